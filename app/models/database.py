@@ -23,7 +23,7 @@ class DiseaseBase(BaseModel):
     article_id: Optional[str] = None
 
 class DiseaseCreate(DiseaseBase):
-    pass
+    created_by: Optional[str] = None
 
 class DiseaseUpdate(DiseaseBase):
     label: Optional[str] = None
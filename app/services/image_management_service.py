@@ -90,9 +90,13 @@ async def validate_image(file: UploadFile) -> Tuple[bool, Optional[str]]:
     await file.seek(0)
     return True, None
 
-async def init_image_usages(db: Session):
+async def init_image_usages(db: Session, commit: bool = True):
     """
     Khởi tạo các loại usage cho hình ảnh
+
+    Args:
+        db: Database session
+        commit: Nếu False, chỉ flush và để người gọi commit
     """
     try:
         # Kiểm tra xem usage "thumbnail" đã tồn tại chưa
@@ -102,7 +106,7 @@ async def init_image_usages(db: Session):
                 usage="thumbnail",
                 description="Hình ảnh nhỏ dùng cho hiển thị danh sách"
             )
-            crud.image_usage.create(db, obj_in=thumbnail_data)
+            crud.image_usage.create(db, obj_in=thumbnail_data, commit=commit)
             logger.app_info("Created thumbnail image usage")
         
         # Kiểm tra xem usage "cover" đã tồn tại chưa
@@ -112,7 +116,7 @@ async def init_image_usages(db: Session):
                 usage="cover",
                 description="Hình ảnh bìa hiển thị đầy đủ"
             )
-            crud.image_usage.create(db, obj_in=cover_data)
+            crud.image_usage.create(db, obj_in=cover_data, commit=commit)
             logger.app_info("Created cover image usage")
             
     except Exception as e:
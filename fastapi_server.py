@@ -2,18 +2,29 @@
 
 import os
 import json
-import base64
+import pickle
 import torch
 import torchvision.transforms as transforms
 from PIL import Image
 from io import BytesIO
 from typing import List, Dict, Optional
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Request, Response
+import msgspec
 import uvicorn
 import logging
 import argparse
 
+# SIMD-accelerated base64 and direct-to-RGB JPEG decoding when available
+try:
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+try:
+    import simplejpeg
+except ImportError:
+    simplejpeg = None
+
 # Import the distilled model
 from runtime.trained_model.distilled_model import DistilledModel
 
@@ -21,14 +32,31 @@ from runtime.trained_model.distilled_model import DistilledModel
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Upload contract: clients should pre-resize to at most MAX_SIDE px (JPEG);
+# anything above the hard limits below is rejected with 413
+MAX_SIDE = 256
+MAX_IMAGE_BYTES = 200_000
+MAX_IMAGE_DIMENSION = 1024
+
 # Request/Response models
-class EncodeRequest(BaseModel):
+class EncodeRequest(msgspec.Struct):
+    """
+    Encode request body.
+
+    images: base64-encoded images, ideally JPEG pre-resized to <= MAX_SIDE px.
+    Images larger than MAX_IMAGE_BYTES or MAX_IMAGE_DIMENSION px on either
+    side are rejected with 413.
+    """
     images: Optional[List[str]] = None
     texts: Optional[List[str]] = None
 
-class EncodeResponse(BaseModel):
+class EncodeResponse(msgspec.Struct):
     image_embeddings: List[List[float]]
 
+# JSON schemas of the msgspec models, declared on /encode so the request and
+# response contract still shows up in the OpenAPI docs
+_, _SCHEMAS = msgspec.json.schema_components([EncodeRequest, EncodeResponse])
+
 # Global variables
 app = FastAPI(title="Image Encoding API", version="1.0.0")
 model = None
@@ -36,9 +64,19 @@ device = None
 transform = None
 model_dir = None
 
+# ImageNet normalization constants, kept on the model device
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+_MEAN = None
+_STD_RECIP = None
+
+# Pinned host buffer and side stream for device-to-host copies of embeddings (CUDA only)
+_HOST_OUT = None
+_COPY_STREAM = None
+
 def load_model(model_directory: str):
     """Load the distilled model from checkpoint."""
-    global model, device, transform
+    global model, device, transform, _MEAN, _STD_RECIP, _COPY_STREAM
     
     if not os.path.exists(model_directory):
         raise FileNotFoundError(f"Model directory không tồn tại: {model_directory}")
@@ -71,53 +109,129 @@ def load_model(model_directory: str):
     if not os.path.exists(checkpoint_path):
         raise FileNotFoundError(f"Model checkpoint không tồn tại: {checkpoint_path}")
         
-    checkpoint = torch.load(checkpoint_path, map_location=device)
+    # Memory-map the checkpoint instead of reading it fully into RAM.
+    # Training checkpoints may also carry optimizer state, epoch counters or
+    # numpy scalars that the weights-only unpickler rejects; those are
+    # trusted local files, so retry with the full unpickler
+    try:
+        checkpoint = torch.load(checkpoint_path, map_location='cpu', mmap=True, weights_only=True)
+    except pickle.UnpicklingError as e:
+        logger.warning(f"Weights-only load failed, retrying with weights_only=False: {e}")
+        checkpoint = torch.load(checkpoint_path, map_location='cpu', mmap=True, weights_only=False)
     
-    # Load state dict
+    # Load state dict (assign=True reuses the loaded tensors instead of copying)
     if 'model_state_dict' in checkpoint:
-        model.load_state_dict(checkpoint['model_state_dict'])
+        model.load_state_dict(checkpoint['model_state_dict'], assign=True)
     else:
-        model.load_state_dict(checkpoint)
+        model.load_state_dict(checkpoint, assign=True)
     
     model.to(device)
     model.eval()
     
-    # Define image transforms
+    # Define image transforms (input is a uint8 CHW tensor, output stays uint8;
+    # scaling and normalization run batched on the device in encode_images)
     transform = transforms.Compose([
-        transforms.Resize((224, 224)),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+        transforms.Resize((224, 224), antialias=True),
     ])
+    _MEAN = torch.tensor(IMAGENET_MEAN, device=device).view(1, 3, 1, 1)
+    _STD_RECIP = (1.0 / torch.tensor(IMAGENET_STD, device=device)).view(1, 3, 1, 1)
+    
+    if device.type == 'cuda':
+        _COPY_STREAM = torch.cuda.Stream()
     
     logger.info("Model loaded successfully")
 
-def decode_base64_image(base64_string: str) -> Image.Image:
-    """Decode base64 string to PIL Image."""
+def check_image_dimensions(width: int, height: int):
+    """Reject images exceeding the upload contract."""
+    if max(width, height) > MAX_IMAGE_DIMENSION:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Image too large: {width}x{height} (max side {MAX_IMAGE_DIMENSION}px)"
+        )
+
+def decode_base64_image(base64_string: str) -> torch.Tensor:
+    """Decode base64 string to a uint8 RGB tensor of shape (3, H, W)."""
     try:
         # Remove data URL prefix if present
         if base64_string.startswith('data:image'):
             base64_string = base64_string.split(',')[1]
         
         # Decode base64
-        image_data = base64.b64decode(base64_string)
+        image_data = base64.b64decode(base64_string, validate=False)
+        if len(image_data) > MAX_IMAGE_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Image too large: {len(image_data)} bytes (max {MAX_IMAGE_BYTES})"
+            )
+
+        # Fast path: JPEG straight to a contiguous HWC RGB array, no PIL object.
+        # Anything simplejpeg cannot handle (e.g. some CMYK/YCCK JPEGs) falls
+        # through to the PIL path below
+        if simplejpeg is not None and simplejpeg.is_jpeg(image_data):
+            try:
+                height, width, _, _ = simplejpeg.decode_jpeg_header(image_data)
+            except ValueError:
+                pass
+            else:
+                check_image_dimensions(width, height)
+                try:
+                    array = simplejpeg.decode_jpeg(
+                        image_data, colorspace='RGB', min_height=256, min_width=256
+                    )
+                    return torch.from_numpy(array).permute(2, 0, 1)
+                except ValueError as e:
+                    logger.debug(f"simplejpeg decode failed, falling back to PIL: {e}")
+
         image = Image.open(BytesIO(image_data))
-        
+        check_image_dimensions(*image.size)
+
+        # Let libjpeg decode at a reduced scale (no-op for non-JPEG formats);
+        # the result stays >= the draft size so Resize((224, 224)) is unaffected
+        image.draft('RGB', (256, 256))
+        image.load()
+
         # Convert to RGB if necessary
         if image.mode != 'RGB':
             image = image.convert('RGB')
             
-        return image
+        return transforms.functional.pil_to_tensor(image)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid base64 image: {str(e)}")
 
-def preprocess_image(image: Image.Image) -> torch.Tensor:
+def preprocess_image(image: torch.Tensor) -> torch.Tensor:
     """Preprocess image for model input."""
     return transform(image)
 
+def embeddings_to_host(embeddings: torch.Tensor) -> torch.Tensor:
+    """Copy embeddings to host memory, through a reused pinned buffer on CUDA."""
+    global _HOST_OUT
+    
+    if _COPY_STREAM is None:
+        return embeddings.cpu()
+    
+    n = embeddings.shape[0]
+    if _HOST_OUT is None or _HOST_OUT.shape[0] < n or _HOST_OUT.shape[1:] != embeddings.shape[1:] \
+            or _HOST_OUT.dtype != embeddings.dtype:
+        _HOST_OUT = torch.empty(embeddings.shape, dtype=embeddings.dtype, pin_memory=True)
+    
+    # Copy on the side stream once the producing kernels have finished
+    _COPY_STREAM.wait_stream(torch.cuda.current_stream())
+    with torch.cuda.stream(_COPY_STREAM):
+        _HOST_OUT[:n].copy_(embeddings, non_blocking=True)
+    _COPY_STREAM.synchronize()
+    
+    return _HOST_OUT[:n]
+
 @app.on_event("startup")
 async def startup_event():
     """Load model on startup."""
     load_model(model_dir)
+    logger.info(
+        f"Upload contract: send JPEG images pre-resized to <= {MAX_SIDE}x{MAX_SIDE}; "
+        f"images over {MAX_IMAGE_BYTES} bytes or {MAX_IMAGE_DIMENSION}px per side are rejected with 413"
+    )
 
 @app.get("/")
 async def root():
@@ -133,18 +247,38 @@ async def health_check():
         "device": str(device) if device else None
     }
 
-@app.post("/encode", response_model=EncodeResponse)
-async def encode_images(request: EncodeRequest):
+@app.post(
+    "/encode",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": _SCHEMAS["EncodeRequest"]}}
+        }
+    },
+    responses={
+        200: {
+            "description": "Image embeddings",
+            "content": {"application/json": {"schema": _SCHEMAS["EncodeResponse"]}}
+        }
+    }
+)
+async def encode_images(raw_request: Request):
     """
     Encode images to embeddings.
     
     Args:
-        request: Request containing images as base64 strings and texts
+        raw_request: Request whose JSON body matches EncodeRequest
+            (images as base64 strings and texts)
         
     Returns:
         Response containing image embeddings
     """
     try:
+        try:
+            request = msgspec.json.decode(await raw_request.body(), type=EncodeRequest)
+        except msgspec.DecodeError as e:
+            raise HTTPException(status_code=422, detail=f"Invalid request body: {str(e)}")
+        
         if model is None:
             raise HTTPException(status_code=500, detail="Model not loaded")
         
@@ -161,19 +295,23 @@ async def encode_images(request: EncodeRequest):
             image_tensor = preprocess_image(image)
             image_tensors.append(image_tensor)
         
-        # Stack images into batch
-        batch_tensor = torch.stack(image_tensors).to(device)
+        # Stack images into a uint8 batch, then scale and normalize on device
+        batch_tensor = torch.stack(image_tensors).to(device).float().div_(255)
+        batch_tensor = batch_tensor.sub_(_MEAN).mul_(_STD_RECIP)
         
         # Get embeddings
         with torch.no_grad():
             embeddings = model.encode(batch_tensor, normalize=True)
         
         # Convert to list format
-        embeddings_list = embeddings.cpu().numpy().tolist()
+        embeddings_list = embeddings_to_host(embeddings).numpy().tolist()
         
-        logger.info(f"Encoded {len(request.images)} images to embeddings")
+        logger.info("Encoded %d images to embeddings", len(request.images))
         
-        return EncodeResponse(image_embeddings=embeddings_list)
+        return Response(
+            content=msgspec.json.encode(EncodeResponse(image_embeddings=embeddings_list)),
+            media_type="application/json"
+        )
         
     except HTTPException:
         raise
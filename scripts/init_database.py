@@ -11,6 +11,8 @@ import hashlib
 import uuid
 from datetime import datetime, timezone
 import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
 
 # Thêm thư mục gốc vào sys.path để import các module từ app
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -36,7 +38,7 @@ def create_admin_role(db) -> str:
         return existing_role.role_id
     
     role_data = RoleCreate(role="ADMIN")
-    role = crud.role.create(db, obj_in=role_data)
+    role = crud.role.create(db, obj_in=role_data, commit=False)
     print(f"Đã tạo role ADMIN với ID: {role.role_id}")
     return role.role_id
 
@@ -69,7 +71,7 @@ def create_admin_user(db, username, password, role_id) -> str:
         role_id=role_id
     )
     
-    user = crud.user.create(db, obj_in=user_data)
+    user = crud.user.create(db, obj_in=user_data, commit=False)
     print(f"Đã tạo tài khoản admin {username} với ID: {user.user_id} và hashpass: {hashed_password}")
     return user.user_id
 
@@ -80,19 +82,30 @@ def initialize_image_usages(db):
     
     try:
         loop = asyncio.get_event_loop()
-        loop.run_until_complete(init_image_usages(db))
+        loop.run_until_complete(init_image_usages(db, commit=False))
         print("Đã khởi tạo các loại sử dụng hình ảnh")
     except Exception as e:
         print(f"Lỗi khi khởi tạo các loại sử dụng hình ảnh: {str(e)}")
 
+def configure_sqlite(db):
+    """
+    Bật WAL, giảm số lần fsync và mở rộng page cache (mmap 256MB, cache 64MB)
+    cho các thao tác ghi khi khởi tạo
+    """
+    db.execute(text("PRAGMA journal_mode=WAL"))
+    db.execute(text("PRAGMA synchronous=NORMAL"))
+    db.execute(text("PRAGMA temp_store=MEMORY"))
+    db.execute(text("PRAGMA mmap_size=268435456"))
+    db.execute(text("PRAGMA cache_size=-65536"))
+
 def ensure_image_directories():
     """Đảm bảo các thư mục lưu trữ hình ảnh tồn tại"""
     from app.services.image_management_service import IMAGE_ROOT_DIR, VALID_OBJECT_TYPES
     
-    for object_type in VALID_OBJECT_TYPES:
-        dir_path = os.path.join(IMAGE_ROOT_DIR, object_type)
-        os.makedirs(dir_path, exist_ok=True)
-        print(f"Đã đảm bảo thư mục hình ảnh tồn tại: {dir_path}")
+    dir_paths = [os.path.join(IMAGE_ROOT_DIR, object_type) for object_type in VALID_OBJECT_TYPES]
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        list(executor.map(lambda dir_path: os.makedirs(dir_path, exist_ok=True), dir_paths))
+    print(f"Đã đảm bảo {len(dir_paths)} thư mục hình ảnh tồn tại trong: {IMAGE_ROOT_DIR}")
 
 def main():
     parser = argparse.ArgumentParser(description="Khởi tạo cơ sở dữ liệu và tạo tài khoản admin")
@@ -127,6 +140,8 @@ def main():
     db = next(db_generator)
     
     try:
+        configure_sqlite(db)
+        
         # Tạo role ADMIN
         role_id = create_admin_role(db)
         
@@ -136,8 +151,12 @@ def main():
         # Khởi tạo các loại sử dụng hình ảnh
         initialize_image_usages(db)
         
+        # Ghi tất cả thay đổi trong một transaction duy nhất
+        db.commit()
+        
         print("Khởi tạo cơ sở dữ liệu thành công!")
     except Exception as e:
+        db.rollback()
         print(f"Lỗi khi khởi tạo cơ sở dữ liệu: {str(e)}")
     finally:
         # Đóng phiên làm việc
@@ -8,13 +8,15 @@ Script khởi tạo cơ sở dữ liệu mở rộng:
 """
 import os
 import sys
-import json
 import hashlib
 import uuid
 import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import glob
+import orjson
 from typing import Dict, List, Optional, Any
+from sqlalchemy import text
 
 # Thêm thư mục gốc vào sys.path để import các module từ app
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -27,6 +29,7 @@ from app.models.database import (
     ArticleCreate, ClinicCreate, ImageCreate, ImageMapCreate
 )
 from app.db import crud
+from app.db.models import Clinic, Disease, Image, ImageMap, generate_uuid
 from app.services import image_management_service
 
 # Đường dẫn đến file labels.json
@@ -35,6 +38,17 @@ LABELS_JSON_PATH = "labels.json"
 CHUNKED_DATA_DIR = "chunked_data"
 # Đường dẫn đến thư mục hình ảnh
 IMAGE_ROOT_DIR = "runtime/image"
+# MIME type theo phần mở rộng của file hình ảnh
+MIME_BY_EXT = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp"
+}
+# Bảng chuẩn hóa tên bệnh thành tên thư mục trong chunked_data
+_NORMALIZE_TABLE = str.maketrans({" ": "_", "-": "_", "(": None, ")": None})
+# Bảng loại bỏ dấu ngoặc khi lấy tiền tố tên bệnh
+_STRIP_PARENS_TABLE = str.maketrans("", "", "()")
 
 def load_labels_data() -> Dict[str, Any]:
     """
@@ -43,12 +57,47 @@ def load_labels_data() -> Dict[str, Any]:
     Returns:
         Dict: Dữ liệu từ file labels.json
     """
-    with open(LABELS_JSON_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
+    with open(LABELS_JSON_PATH, "rb") as f:
+        return orjson.loads(f.read())
 
+@functools.lru_cache(maxsize=None)
+def get_chunk_index() -> Dict[str, List[str]]:
+    """
+    Quét thư mục chunked_data một lần duy nhất
+    
+    Returns:
+        Dict: {tên thư mục bệnh: danh sách đường dẫn file chunk đã sắp xếp}
+    """
+    index = {}
+    with os.scandir(CHUNKED_DATA_DIR) as folders:
+        for folder in folders:
+            if not folder.is_dir():
+                continue
+            with os.scandir(folder.path) as files:
+                index[folder.name] = sorted(
+                    entry.path for entry in files
+                    if entry.name.endswith(".json") and entry.is_file()
+                )
+    return index
+
+@functools.lru_cache(maxsize=None)
+def get_folder_by_prefix() -> Dict[str, str]:
+    """
+    Lập chỉ mục thư mục chunked_data theo từ đầu tiên của tên thư mục
+    
+    Returns:
+        Dict: {từ đầu tiên: tên thư mục đầu tiên bắt đầu bằng từ đó}
+    """
+    folder_by_prefix = {}
+    for dirname in get_chunk_index():
+        folder_by_prefix.setdefault(dirname.split("_")[0], dirname)
+    return folder_by_prefix
+
+@functools.lru_cache(maxsize=None)
 def get_disease_description(disease_name: str) -> str:
     """
-    Lấy mô tả bệnh từ các file chunked data
+    Lấy mô tả bệnh từ các file chunked data (kết quả được cache theo tên bệnh,
+    vì create_articles_with_images đọc lại mô tả của các bệnh đã tạo)
     
     Args:
         disease_name: Tên bệnh
@@ -56,36 +105,35 @@ def get_disease_description(disease_name: str) -> str:
     Returns:
         str: Mô tả bệnh, hoặc chuỗi rỗng nếu không tìm thấy
     """
+    chunk_index = get_chunk_index()
+    
     # Chuẩn hóa tên thư mục
-    folder_name = disease_name.replace(" ", "_").replace("(", "").replace(")", "").replace("-", "_")
-    folder_path = os.path.join(CHUNKED_DATA_DIR, folder_name)
+    folder_name = disease_name.translate(_NORMALIZE_TABLE)
+    json_files = chunk_index.get(folder_name)
     
     # Nếu không tìm thấy thư mục chính xác, thử tìm thư mục tương tự
-    if not os.path.exists(folder_path):
-        for dirname in os.listdir(CHUNKED_DATA_DIR):
-            if dirname.startswith(disease_name.split()[0].replace("(", "").replace(")", "")):
-                folder_path = os.path.join(CHUNKED_DATA_DIR, dirname)
-                break
+    if json_files is None:
+        prefix = disease_name.split()[0].translate(_STRIP_PARENS_TABLE)
+        dirname = get_folder_by_prefix().get(prefix)
+        if dirname is not None:
+            json_files = chunk_index[dirname]
     
     # Nếu vẫn không tìm thấy, trả về chuỗi rỗng
-    if not os.path.exists(folder_path):
+    if json_files is None:
         print(f"Không tìm thấy thư mục cho bệnh: {disease_name}")
         return ""
     
-    # Tìm file _0.json (tổng quan)
-    json_files = glob.glob(os.path.join(folder_path, "*.json"))
-    content = ""
-    
     # Đọc nội dung từ tất cả các file chunk
-    for json_file in sorted(json_files):
+    parts = []
+    for json_file in json_files:
         try:
-            with open(json_file, "r", encoding="utf-8") as f:
-                chunk_data = json.load(f)
-                content += chunk_data.get("content", "") + "\n\n"
+            with open(json_file, "rb") as f:
+                chunk_data = orjson.loads(f.read())
+            parts.append(chunk_data.get("content", "") + "\n\n")
         except Exception as e:
             print(f"Lỗi khi đọc file {json_file}: {str(e)}")
     
-    return content
+    return "".join(parts)
 
 def create_admin_role(db) -> str:
     """
@@ -176,36 +224,41 @@ def create_diseases(db, standard_diseases: List[str], domain_id: str, created_by
         created_by: ID của người tạo
     """
     created_count = 0
-    for disease_name in standard_diseases:
-        # Kiểm tra xem bệnh đã tồn tại chưa
-        existing_disease = crud.disease.get_by_label(db, label=disease_name)
-        if existing_disease:
-            print(f"Bệnh {disease_name} đã tồn tại với ID: {existing_disease.id}")
-            continue
-        
-        # Lấy mô tả bệnh từ chunked_data
-        description = get_disease_description(disease_name)
-        
-        # Tạo bệnh mới
-        disease_data = DiseaseCreate(
-            label=disease_name,
-            domain_id=domain_id,
-            description=description,
-            included_in_diagnosis=True
+    try:
+        # Lấy các bệnh đã tồn tại bằng một truy vấn IN duy nhất
+        existing_ids = dict(
+            db.query(Disease.label, Disease.id).filter(Disease.label.in_(standard_diseases)).all()
         )
         
-        try:
-            disease = crud.disease.create(db, obj_in=disease_data)
+        # Tạo tất cả bệnh trong một transaction, chỉ commit một lần ở cuối
+        for disease_name in standard_diseases:
+            # Kiểm tra xem bệnh đã tồn tại chưa
+            if disease_name in existing_ids:
+                print(f"Bệnh {disease_name} đã tồn tại với ID: {existing_ids[disease_name]}")
+                continue
             
-            # Cập nhật trường created_by
-            disease.created_by = created_by
-            db.add(disease)
-            db.commit()
+            # Lấy mô tả bệnh từ chunked_data
+            description = get_disease_description(disease_name)
+            
+            # Tạo bệnh mới
+            disease_data = DiseaseCreate(
+                label=disease_name,
+                domain_id=domain_id,
+                description=description,
+                included_in_diagnosis=True,
+                created_by=created_by
+            )
             
+            disease = crud.disease.create(db, obj_in=disease_data, commit=False)
+            existing_ids[disease_name] = disease.id
             created_count += 1
             print(f"Đã tạo bệnh {disease_name} với ID: {disease.id}")
-        except Exception as e:
-            print(f"Lỗi khi tạo bệnh {disease_name}: {str(e)}")
+        
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Lỗi khi tạo bệnh, đã hủy toàn bộ thay đổi: {str(e)}")
+        return
     
     print(f"Đã tạo {created_count} bệnh từ standard_diseases")
 
@@ -245,21 +298,18 @@ async def create_articles_with_images(db, created_by: str):
         article_data = ArticleCreate(
             title=f"Thông tin về {disease_name}",
             summary=f"Thông tin chi tiết và hướng dẫn điều trị {disease_name}",
-            content=content
+            content=content,
+            created_by=created_by
         )
         
+        # Bài viết, article_id của bệnh, hình ảnh và ImageMap được ghi trong
+        # cùng một transaction, chỉ commit một lần cho mỗi bệnh
         try:
-            article = crud.article.create(db, obj_in=article_data)
-            
-            # Cập nhật trường created_by
-            article.created_by = created_by
-            db.add(article)
-            db.commit()
+            article = crud.article.create(db, obj_in=article_data, commit=False)
             
             # Cập nhật article_id trong disease
             disease.article_id = article.id
             db.add(disease)
-            db.commit()
             
             print(f"Đã tạo bài viết cho bệnh {disease_name} với ID: {article.id}")
             
@@ -272,13 +322,11 @@ async def create_articles_with_images(db, created_by: str):
                     image_data = ImageCreate(
                         base_url="/static/images",
                         rel_path=f"article/{image_filename}",
-                        mime_type="image/jpeg" if image_filename.endswith(".jpg") else 
-                                 "image/png" if image_filename.endswith(".png") else
-                                 "image/webp" if image_filename.endswith(".webp") else "image/jpeg",
+                        mime_type=MIME_BY_EXT.get(os.path.splitext(image_filename)[1].lower(), "image/jpeg"),
                         uploaded_by=created_by
                     )
                     
-                    image = crud.image.create(db, obj_in=image_data)
+                    image = crud.image.create(db, obj_in=image_data, commit=False)
                     
                     # Tạo bản ghi ImageMap
                     image_map_data = ImageMapCreate(
@@ -288,11 +336,14 @@ async def create_articles_with_images(db, created_by: str):
                         usage="cover"
                     )
                     
-                    image_map = crud.image_map.create(db, obj_in=image_map_data)
+                    image_map = crud.image_map.create(db, obj_in=image_map_data, commit=False)
                     print(f"Đã thêm hình ảnh {image_filename} cho bài viết {article.id}")
                 else:
                     print(f"Không tìm thấy file hình ảnh {image_path}")
+            
+            db.commit()
         except Exception as e:
+            db.rollback()
             print(f"Lỗi khi tạo bài viết cho bệnh {disease_name}: {str(e)}")
 
 async def create_clinics_with_images(db, created_by: str):
@@ -331,8 +382,12 @@ async def create_clinics_with_images(db, created_by: str):
         }
     ]
     
+    # Sinh ID phía Python để liên kết phòng khám, hình ảnh và ImageMap mà không
+    # cần truy vấn lại, rồi ghi tất cả bằng bulk insert trong một transaction
+    clinic_rows = []
+    image_rows = []
+    image_map_rows = []
     for clinic_info in clinics_info:
-        # Tạo phòng khám mới
         clinic_data = ClinicCreate(
             name=clinic_info["name"],
             description=clinic_info["description"],
@@ -340,64 +395,91 @@ async def create_clinics_with_images(db, created_by: str):
             phone_number=clinic_info["phone_number"],
             website=clinic_info["website"]
         )
+        clinic_id = generate_uuid()
+        clinic_rows.append({**clinic_data.model_dump(), "id": clinic_id, "created_by": created_by})
         
-        try:
-            clinic = crud.clinic.create(db, obj_in=clinic_data)
+        # Thêm hình ảnh cho phòng khám
+        image_path = os.path.join(IMAGE_ROOT_DIR, "clinic", clinic_info["image"])
+        if os.path.exists(image_path):
+            image_data = ImageCreate(
+                base_url="/static/images",
+                rel_path=f"clinic/{clinic_info['image']}",
+                mime_type=MIME_BY_EXT.get(os.path.splitext(clinic_info["image"])[1].lower(), "image/jpeg"),
+                uploaded_by=created_by
+            )
+            image_id = generate_uuid()
+            image_rows.append({**image_data.model_dump(), "id": image_id})
             
-            # Cập nhật trường created_by
-            clinic.created_by = created_by
-            db.add(clinic)
-            db.commit()
-            
-            print(f"Đã tạo phòng khám {clinic_info['name']} với ID: {clinic.id}")
-            
-            # Thêm hình ảnh cho phòng khám
-            image_path = os.path.join(IMAGE_ROOT_DIR, "clinic", clinic_info["image"])
-            if os.path.exists(image_path):
-                # Tạo bản ghi hình ảnh
-                image_data = ImageCreate(
-                    base_url="/static/images",
-                    rel_path=f"clinic/{clinic_info['image']}",
-                    mime_type="image/jpeg",
-                    uploaded_by=created_by
-                )
-                
-                image = crud.image.create(db, obj_in=image_data)
-                
-                # Tạo bản ghi ImageMap
-                image_map_data = ImageMapCreate(
-                    image_id=image.id,
-                    object_type="clinic",
-                    object_id=clinic.id,
-                    usage="cover"
-                )
-                
-                image_map = crud.image_map.create(db, obj_in=image_map_data)
-                print(f"Đã thêm hình ảnh {clinic_info['image']} cho phòng khám {clinic.id}")
-            else:
-                print(f"Không tìm thấy file hình ảnh {image_path}")
-        except Exception as e:
-            print(f"Lỗi khi tạo phòng khám {clinic_info['name']}: {str(e)}")
+            image_map_data = ImageMapCreate(
+                image_id=image_id,
+                object_type="clinic",
+                object_id=clinic_id,
+                usage="cover"
+            )
+            image_map_rows.append({**image_map_data.model_dump(), "id": generate_uuid()})
+        else:
+            print(f"Không tìm thấy file hình ảnh {image_path}")
+    
+    try:
+        db.bulk_insert_mappings(Clinic, clinic_rows)
+        db.bulk_insert_mappings(Image, image_rows)
+        db.bulk_insert_mappings(ImageMap, image_map_rows)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Lỗi khi tạo phòng khám, đã hủy toàn bộ thay đổi: {str(e)}")
+        return
+    
+    for clinic_row in clinic_rows:
+        print(f"Đã tạo phòng khám {clinic_row['name']} với ID: {clinic_row['id']}")
+    print(f"Đã thêm {len(image_rows)} hình ảnh cho phòng khám")
 
-def initialize_image_usages(db):
+async def initialize_image_usages(db):
     """Khởi tạo các loại sử dụng hình ảnh"""
     from app.services.image_management_service import init_image_usages
     
     try:
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(init_image_usages(db))
+        await init_image_usages(db)
         print("Đã khởi tạo các loại sử dụng hình ảnh")
     except Exception as e:
         print(f"Lỗi khi khởi tạo các loại sử dụng hình ảnh: {str(e)}")
 
+async def _bootstrap(db, user_id: str):
+    """
+    Chạy các bước khởi tạo bất đồng bộ trong cùng một event loop
+    
+    Args:
+        db: Database session
+        user_id: ID của người tạo
+    """
+    # Khởi tạo các loại sử dụng hình ảnh
+    await initialize_image_usages(db)
+    
+    # Tạo bài đăng với hình ảnh
+    await create_articles_with_images(db, user_id)
+    
+    # Tạo phòng khám với hình ảnh
+    await create_clinics_with_images(db, user_id)
+
+def configure_sqlite(db):
+    """
+    Bật WAL, giảm số lần fsync và mở rộng page cache (mmap 256MB, cache 64MB)
+    cho các thao tác ghi khi khởi tạo
+    """
+    db.execute(text("PRAGMA journal_mode=WAL"))
+    db.execute(text("PRAGMA synchronous=NORMAL"))
+    db.execute(text("PRAGMA temp_store=MEMORY"))
+    db.execute(text("PRAGMA mmap_size=268435456"))
+    db.execute(text("PRAGMA cache_size=-65536"))
+
 def ensure_image_directories():
     """Đảm bảo các thư mục lưu trữ hình ảnh tồn tại"""
     from app.services.image_management_service import IMAGE_ROOT_DIR, VALID_OBJECT_TYPES
     
-    for object_type in VALID_OBJECT_TYPES:
-        dir_path = os.path.join(IMAGE_ROOT_DIR, object_type)
-        os.makedirs(dir_path, exist_ok=True)
-        print(f"Đã đảm bảo thư mục hình ảnh tồn tại: {dir_path}")
+    dir_paths = [os.path.join(IMAGE_ROOT_DIR, object_type) for object_type in VALID_OBJECT_TYPES]
+    with ThreadPoolExecutor(max_workers=len(dir_paths) or 1) as executor:
+        list(executor.map(lambda dir_path: os.makedirs(dir_path, exist_ok=True), dir_paths))
+    print(f"Đã đảm bảo {len(dir_paths)} thư mục hình ảnh tồn tại trong: {IMAGE_ROOT_DIR}")
 
 def main():
     import argparse
@@ -434,15 +516,14 @@ def main():
     db = next(db_generator)
     
     try:
+        configure_sqlite(db)
+        
         # Tạo role ADMIN
         role_id = create_admin_role(db)
         
         # Tạo tài khoản admin
         user_id = create_admin_user(db, args.username, args.password, role_id)
         
-        # Khởi tạo các loại sử dụng hình ảnh
-        initialize_image_usages(db)
-        
         # Tạo domain STANDARD
         domain_id = create_standard_domain(db, user_id)
         
@@ -453,12 +534,8 @@ def main():
         # Tạo diseases từ standard_diseases
         create_diseases(db, standard_diseases, domain_id, user_id)
         
-        # Tạo bài đăng với hình ảnh
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(create_articles_with_images(db, user_id))
-        
-        # Tạo phòng khám với hình ảnh
-        loop.run_until_complete(create_clinics_with_images(db, user_id))
+        # Khởi tạo loại sử dụng hình ảnh, tạo bài đăng và phòng khám với hình ảnh
+        asyncio.run(_bootstrap(db, user_id))
         
         print("Khởi tạo cơ sở dữ liệu mở rộng thành công!")
     except Exception as e:
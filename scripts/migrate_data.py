@@ -7,6 +7,7 @@ import os
 from pathlib import Path
 import argparse
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 # Thêm thư mục gốc vào sys.path
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -36,30 +37,43 @@ def copy_file(src, dest):
     os.makedirs(dest_dir, exist_ok=True)
     shutil.copy2(src, dest)
 
+def copy_files(file_mapping, present):
+    """Copy files in parallel; when several sources share a destination, the last one wins"""
+    src_by_dest = {}
+    for src, dest in file_mapping.items():
+        if src in present:
+            src_by_dest[dest] = src
+        else:
+            print(f"Warning: Source file {src} not found")
+    
+    with ThreadPoolExecutor(max_workers=(os.cpu_count() or 1) * 2) as executor:
+        list(executor.map(lambda item: copy_file(item[1], item[0]), src_by_dest.items()))
+
 def copy_dir(src, dest):
     """Copy directory from source to destination"""
     print(f"Copying directory {src} to {dest}")
     if os.path.exists(dest):
         shutil.rmtree(dest)
-    shutil.copytree(src, dest)
+    # Skip copying file metadata; copyfile uses the kernel's zero-copy path
+    shutil.copytree(src, dest, copy_function=shutil.copyfile)
 
 def migrate_data():
     """Migrate data from old structure to new structure"""
+    # Liệt kê thư mục gốc một lần; mọi nguồn trong mapping đều nằm ở cấp này
+    with os.scandir(".") as entries:
+        present = {entry.name for entry in entries}
+    
     # Kiểm tra thư mục hiện tại là thư mục gốc
-    if not os.path.exists("app") or not os.path.exists("runtime"):
+    if "app" not in present or "runtime" not in present:
         print("Error: Please run this script from the project root directory")
         sys.exit(1)
         
     # Di chuyển files
-    for src, dest in FILE_MAPPING.items():
-        if os.path.exists(src):
-            copy_file(src, dest)
-        else:
-            print(f"Warning: Source file {src} not found")
+    copy_files(FILE_MAPPING, present)
             
     # Di chuyển directories
     for src, dest in DIR_MAPPING.items():
-        if os.path.exists(src):
+        if src in present:
             copy_dir(src, dest)
         else:
             print(f"Warning: Source directory {src} not found")
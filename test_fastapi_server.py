@@ -1,14 +1,16 @@
 """Test script for FastAPI image encoding server."""
 
-import requests
+import asyncio
+import httpx
 import base64
 import json
+import mmap
 from PIL import Image
 import io
 import numpy as np
 
-def create_test_image() -> str:
-    """Create a test image and convert to base64."""
+def _make_red_image_b64() -> str:
+    """Create a solid red test image and convert to base64."""
     # Create a simple test image
     image = Image.new('RGB', (224, 224), color='red')
     
@@ -20,10 +22,17 @@ def create_test_image() -> str:
     
     return base64_string
 
-def test_health_endpoint(base_url: str = "http://localhost:8000"):
+# The test image is deterministic, so encode it once at import time
+_TEST_IMAGE_B64 = _make_red_image_b64()
+
+def create_test_image() -> str:
+    """Return the base64-encoded test image."""
+    return _TEST_IMAGE_B64
+
+async def _check_health_endpoint(client: httpx.AsyncClient, base_url: str = "http://localhost:8000"):
     """Test health check endpoint."""
     try:
-        response = requests.get(f"{base_url}/health")
+        response = await client.get(f"{base_url}/health")
         print(f"Health check status: {response.status_code}")
         print(f"Response: {response.json()}")
         return response.status_code == 200
@@ -31,7 +40,7 @@ def test_health_endpoint(base_url: str = "http://localhost:8000"):
         print(f"Health check failed: {e}")
         return False
 
-def test_encode_endpoint(base_url: str = "http://localhost:8000"):
+async def _check_encode_endpoint(client: httpx.AsyncClient, base_url: str = "http://localhost:8000"):
     """Test encode endpoint."""
     try:
         # Create test images
@@ -45,7 +54,7 @@ def test_encode_endpoint(base_url: str = "http://localhost:8000"):
         }
         
         # Send request
-        response = requests.post(
+        response = await client.post(
             f"{base_url}/encode",
             json=request_data,
             headers={"Content-Type": "application/json"}
@@ -71,13 +80,14 @@ def test_encode_endpoint(base_url: str = "http://localhost:8000"):
         print(f"Encode test failed: {e}")
         return False
 
-def test_encode_with_file_image(image_path: str, base_url: str = "http://localhost:8000"):
+async def _check_encode_with_file_image(client: httpx.AsyncClient, image_path: str,
+                                       base_url: str = "http://localhost:8000"):
     """Test encode endpoint with a real image file."""
     try:
-        # Load and encode image
-        with open(image_path, "rb") as image_file:
-            image_bytes = image_file.read()
-            base64_string = base64.b64encode(image_bytes).decode('utf-8')
+        # Load and encode image (memory-mapped, no intermediate bytes copy)
+        with open(image_path, "rb") as image_file, \
+                mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            base64_string = base64.b64encode(mm).decode("ascii")
         
         # Prepare request
         request_data = {
@@ -86,7 +96,7 @@ def test_encode_with_file_image(image_path: str, base_url: str = "http://localho
         }
         
         # Send request
-        response = requests.post(
+        response = await client.post(
             f"{base_url}/encode",
             json=request_data,
             headers={"Content-Type": "application/json"}
@@ -114,24 +124,55 @@ def test_encode_with_file_image(image_path: str, base_url: str = "http://localho
         print(f"Real image test failed: {e}")
         return False
 
+def _run_with_client(check, *args):
+    """Run one async check on its own client (for standalone/pytest use)."""
+    async def run():
+        async with httpx.AsyncClient(timeout=30) as client:
+            return await check(client, *args)
+    
+    return asyncio.run(run())
+
+def test_health_endpoint(base_url: str = "http://localhost:8000"):
+    """Test health check endpoint."""
+    return _run_with_client(_check_health_endpoint, base_url)
+
+def test_encode_endpoint(base_url: str = "http://localhost:8000"):
+    """Test encode endpoint."""
+    return _run_with_client(_check_encode_endpoint, base_url)
+
+def test_encode_with_file_image(image_path: str = None, base_url: str = "http://localhost:8000"):
+    """Test encode endpoint with a real image file (skipped when no path is given)."""
+    if image_path is None:
+        print("No image path given, skipping real image test")
+        return True
+    return _run_with_client(_check_encode_with_file_image, image_path, base_url)
+
+async def main(base_url: str, image_path: str = None):
+    """Run the health check, then the encode tests concurrently on one client."""
+    async with httpx.AsyncClient(timeout=30) as client:
+        # Test health endpoint
+        print("\n1. Testing health endpoint...")
+        health_ok = await _check_health_endpoint(client, base_url)
+        
+        if health_ok:
+            # Test encode endpoint with synthetic images
+            tests = [_check_encode_endpoint(client, base_url)]
+            
+            # Optionally test with a real image (pass a path)
+            if image_path:
+                tests.append(_check_encode_with_file_image(client, image_path, base_url))
+            
+            print("\n2. Testing encode endpoint...")
+            await asyncio.gather(*tests)
+        else:
+            print("Server not healthy, skipping encode tests")
+
 if __name__ == "__main__":
     base_url = "http://localhost:8000"
+    image_path = None  # "/path/to/your/image.jpg"
     
     print("=== Testing FastAPI Image Encoding Server ===")
     
-    # Test health endpoint
-    print("\n1. Testing health endpoint...")
-    health_ok = test_health_endpoint(base_url)
-    
-    if health_ok:
-        # Test encode endpoint with synthetic images
-        print("\n2. Testing encode endpoint with synthetic images...")
-        encode_ok = test_encode_endpoint(base_url)
-        
-        # Optionally test with a real image (uncomment and provide path)
-        # print("\n3. Testing encode endpoint with real image...")
-        # test_encode_with_file_image("/path/to/your/image.jpg", base_url)
-    else:
-        print("Server not healthy, skipping encode tests")
+    asyncio.run(main(base_url, image_path))
     
-    print("\n=== Test completed ===") 
\ No newline at end of file
+    print("\n=== Test completed ===")
@@ -0,0 +1,75 @@
+"""
+Helper dùng chung cho các file test.
+
+tests/ là một package nhưng các file test cũng được chạy như script
+(python tests/test_x.py), nên các file test import module này theo dạng:
+
+    try:
+        from ._util import save_result
+    except ImportError:
+        from _util import save_result
+"""
+import atexit
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# Thư mục lưu kết quả test, tạo một lần khi import
+RESULTS_DIR = Path("tests/results")
+RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+
+def make_session(pool_maxsize=10, retries=0, headers=None):
+    """
+    Tạo requests.Session dùng chung cho một file test, để các request tái sử dụng
+    kết nối keep-alive. Session được đóng tự động khi thoát (atexit)
+    
+    Args:
+        pool_maxsize: Số kết nối tối đa giữ lại cho mỗi host
+        retries: Số lần thử lại khi lỗi kết nối (0 = không thử lại)
+        headers: Header mặc định thêm vào mọi request
+    """
+    session = requests.Session()
+    max_retries = Retry(total=retries, backoff_factor=0.1) if retries else 0
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=max_retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if headers:
+        session.headers.update(headers)
+    atexit.register(session.close)
+    return session
+
+def save_result(name, obj):
+    """
+    Lưu kết quả test vào tests/results/<name> dưới dạng JSON (indent 2)
+    """
+    (RESULTS_DIR / name).write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+
+def run_test(test_func, label):
+    """
+    Chạy một test và trả về kết quả dạng {"status": ..., "error": ...}
+    
+    Test thất bại bằng cách raise (assert), giống cách pytest thu thập kết quả
+    """
+    try:
+        test_func()
+        return {"status": "passed"}
+    except Exception as e:
+        print(f"❌ {label} test failed: {str(e)}")
+        return {"status": "failed", "error": str(e)}
+
+def run_tests(tests):
+    """
+    Chạy song song các test độc lập (thời gian chủ yếu là chờ mạng)
+    
+    Args:
+        tests: dict tên test -> (test_func, label)
+    
+    Returns:
+        dict: tên test -> kết quả, theo thứ tự của tests
+    """
+    with ThreadPoolExecutor(max_workers=len(tests)) as executor:
+        futures = {name: executor.submit(run_test, *args) for name, args in tests.items()}
+        return {name: future.result() for name, future in futures.items()}
@@ -2,8 +2,8 @@
 """
 Script tạo sample metadata và crossmap files để test
 """
-import json
 import os
+import orjson
 from pathlib import Path
 
 def create_sample_metadata():
@@ -17,16 +17,12 @@ def create_sample_metadata():
     ]
     
     # Extend để có đủ samples
-    extended_metadata = []
-    for i in range(1000):
-        base_item = sample_metadata[i % len(sample_metadata)]
-        extended_metadata.append({
-            "label": base_item["label"],
-            "index": i
-        })
+    labels = [item["label"] for item in sample_metadata]
+    num_labels = len(labels)
+    extended_metadata = [{"label": labels[i % num_labels], "index": i} for i in range(1000)]
     
-    with open("metadata-skincap.json", "w", encoding="utf-8") as f:
-        json.dump(extended_metadata, f, ensure_ascii=False, indent=2)
+    with open("metadata-skincap.json", "wb") as f:
+        f.write(orjson.dumps(extended_metadata, option=orjson.OPT_INDENT_2))
     
     print("✅ Created metadata-skincap.json with 1000 sample entries")
 
@@ -45,8 +41,8 @@ def create_sample_crossmap():
         "folliculitis": "VIÊM NANG LÔNG (Folliculitis)"
     }
     
-    with open("crossmap_SkinCAP.json", "w", encoding="utf-8") as f:
-        json.dump(sample_crossmap, f, ensure_ascii=False, indent=2)
+    with open("crossmap_SkinCAP.json", "wb") as f:
+        f.write(orjson.dumps(sample_crossmap, option=orjson.OPT_INDENT_2))
     
     print("✅ Created crossmap_SkinCAP.json with sample mappings")
 
@@ -10,7 +10,7 @@ from pathlib import Path
 # Thêm thư mục gốc vào sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from tests.test_diagnosis_pipeline import DatabaseDiagnosisPipelineTester
+from tests.test_diagnosis_pipeline import DatabaseDiagnosisPipelineTester, apply_test_env
 
 async def run_simple_test():
     """
@@ -34,23 +34,25 @@ async def run_simple_test():
         print(f"⚠️  Missing environment variables: {', '.join(missing_envs)}")
         print("Using default values for testing...")
     
-    # Khởi tạo tester với 2 samples
-    tester = DatabaseDiagnosisPipelineTester(num_samples=2)
+    # Cấu hình microservices cho test (giống test_diagnosis_pipeline.main)
+    apply_test_env()
     
-    try:
-        # Chạy test
-        test_results = await tester.run_diagnosis_tests()
-        
-        # Lưu kết quả
-        tester.save_results(test_results)
-        
-        return test_results.get('success', False)
-        
-    except Exception as e:
-        print(f"❌ Test failed: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return False
+    # Khởi tạo tester với 2 samples (async with đóng HTTP client khi kết thúc)
+    async with DatabaseDiagnosisPipelineTester(num_samples=2) as tester:
+        try:
+            # Chạy test
+            test_results = await tester.run_diagnosis_tests()
+            
+            # Lưu kết quả
+            tester.save_results(test_results)
+            
+            return test_results.get('success', False)
+            
+        except Exception as e:
+            print(f"❌ Test failed: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            return False
 
 if __name__ == "__main__":
     success = asyncio.run(run_simple_test())
@@ -1,12 +1,33 @@
-import requests
-import json
+import asyncio
+import httpx
+import orjson
 import os
 import uuid
+import functools
 from pathlib import Path
+try:
+    from ._util import make_session, run_tests, save_result
+except ImportError:
+    from _util import make_session, run_tests, save_result
 
 # Cấu hình API endpoint
 BASE_URL = os.environ.get("API_BASE_URL", "http://localhost:8100/api")
 
+SESSION = make_session(pool_maxsize=20)
+
+# Hậu tố ngẫu nhiên cho tên tài nguyên test, sinh sẵn từ một lần đọc os.urandom
+_SUFFIX_POOL = os.urandom(4 * 16).hex()
+_SUFFIXES = iter([_SUFFIX_POOL[i:i + 8] for i in range(0, len(_SUFFIX_POOL), 8)])
+
+def unique_suffix():
+    """
+    Lấy một hậu tố 8 ký tự hex từ pool, sinh thêm bằng uuid4 nếu pool đã hết
+    """
+    return next(_SUFFIXES, None) or uuid.uuid4().hex[:8]
+
+# Kiểm tra đọc không cần token chỉ cần status code, không cần cả danh sách
+READ_CHECK_PARAMS = {"limit": 1}
+
 # Hash mật khẩu bằng SHA256 trước khi gửi đến API
 login_data = {
     "username": "admin",
@@ -25,6 +46,40 @@ login_data_with_hashed_password["password"] = hashed_password
 login_data = login_data_with_hashed_password
 print(hashed_password)
 
+def parse_json(response):
+    """
+    Parse body JSON của response (requests hoặc httpx) bằng orjson
+    """
+    return orjson.loads(response.content)
+
+def fresh_login():
+    """
+    Đăng nhập admin với một token mới, dùng cho các test sẽ thu hồi token
+    
+    Returns:
+        dict: Kết quả đăng nhập (access_token, user_id, ...)
+    """
+    response = SESSION.post(f"{BASE_URL}/auth/login", json=login_data)
+    assert response.status_code == 200, f"Không thể đăng nhập: {response.status_code} - {response.text}"
+    return parse_json(response)
+
+@functools.lru_cache(maxsize=None)
+def admin_login():
+    """
+    Đăng nhập admin một lần và dùng lại kết quả cho các test không thu hồi token
+    
+    Returns:
+        dict: Kết quả đăng nhập (access_token, user_id, ...)
+    """
+    return fresh_login()
+
+@functools.lru_cache(maxsize=None)
+def admin_headers():
+    """
+    Header Authorization cho token admin dùng chung, chỉ tạo một lần
+    """
+    return {"Authorization": f"Bearer {admin_login()['access_token']}"}
+
 def test_login_logout():
     """
     Test các endpoint đăng nhập và đăng xuất
@@ -36,13 +91,13 @@ def test_login_logout():
     hoặc thay đổi thông tin đăng nhập để phù hợp với tài khoản có sẵn
     """
     
-    response = requests.post(f"{BASE_URL}/auth/login", json=login_data)
+    response = SESSION.post(f"{BASE_URL}/auth/login", json=login_data)
     
     # Kiểm tra status code
     assert response.status_code == 200, f"Expected status code 200 but got {response.status_code}: {response.text}"
     
     # Kiểm tra cấu trúc response
-    login_result = response.json()
+    login_result = parse_json(response)
     assert "access_token" in login_result, "Response should contain access_token"
     assert "token_type" in login_result, "Response should contain token_type"
     assert "expires_at" in login_result, "Response should contain expires_at"
@@ -60,13 +115,13 @@ def test_login_logout():
         "token": token
     }
     
-    logout_response = requests.post(f"{BASE_URL}/auth/logout", json=logout_data)
+    logout_response = SESSION.post(f"{BASE_URL}/auth/logout", json=logout_data)
     
     # Kiểm tra status code
     assert logout_response.status_code == 200, f"Expected status code 200 but got {logout_response.status_code}: {logout_response.text}"
     
     # Kiểm tra cấu trúc response
-    logout_result = logout_response.json()
+    logout_result = parse_json(logout_response)
     assert "success" in logout_result, "Response should contain success field"
     assert logout_result["success"] is True, "Logout should be successful"
     
@@ -75,50 +130,37 @@ def test_login_logout():
     # Cố gắng sử dụng token đã đăng xuất để truy cập API
     headers = {"Authorization": f"Bearer {token}"}
 
-    # Test domain post
-    test_domain = {
-        "domain": f"Test Domain without token",
-        "description": "Domain created during auth test"
-    }
-    update_response = requests.post(f"{BASE_URL}/domains", headers=headers, json=test_domain)
-    assert update_response.status_code == 401, f"Expected status code 401 but got {update_response.status_code}"
+    # Dùng GET /domains/{id} (yêu cầu đăng nhập) làm probe, không cần gửi body;
+    # xác thực chạy trước khi tìm domain nên ID không cần tồn tại
+    probe_response = SESSION.get(f"{BASE_URL}/domains/revoked-token-probe", headers=headers)
+    assert probe_response.status_code == 401, f"Expected status code 401 but got {probe_response.status_code}"
     
     print("✅ Token revocation test passed")
-    
-    return True
 
 def test_domain_auth():
     """
     Test xác thực cho các endpoint domain
     """
-    # Đăng nhập để lấy token
-    
-    response = requests.post(f"{BASE_URL}/auth/login", json=login_data)
-    
-    # Xác minh đăng nhập thành công
-    if response.status_code != 200:
-        print(f"⚠️ Không thể đăng nhập: {response.status_code} - {response.text}")
-        return False
-        
-    login_result = response.json()
+    # Đăng nhập với token riêng vì test này sẽ thu hồi token
+    login_result = fresh_login()
     token = login_result["access_token"]
     headers = {"Authorization": f"Bearer {token}"}
     
     # Kiểm tra truy cập các endpoint đọc không có token
-    read_response = requests.get(f"{BASE_URL}/domains")
+    read_response = SESSION.get(f"{BASE_URL}/domains", params=READ_CHECK_PARAMS)
     assert read_response.status_code == 200, "Read endpoints should be accessible without token"
     
     # Kiểm tra tạo domain với token
     test_domain = {
-        "domain": f"Test Auth Domain {uuid.uuid4().hex[:8]}",
+        "domain": f"Test Auth Domain {unique_suffix()}",
         "description": "Domain created during auth test"
     }
     
-    create_response = requests.post(f"{BASE_URL}/domains", json=test_domain, headers=headers)
+    create_response = SESSION.post(f"{BASE_URL}/domains", json=test_domain, headers=headers)
     
     # Xác minh tạo thành công và có trường created_by
     assert create_response.status_code == 200, f"Create with token should succeed: {create_response.status_code} - {create_response.text}"
-    created_domain = create_response.json()
+    created_domain = parse_json(create_response)
     assert "created_by" in created_domain, "Response should include created_by field"
     assert created_domain["created_by"] == login_result["user_id"], "created_by should match the current user ID"
     
@@ -127,93 +169,76 @@ def test_domain_auth():
     
     # Kiểm tra cập nhật domain với token
     update_data = {
-        "description": f"Domain updated during auth test at {uuid.uuid4().hex[:8]}"
+        "description": f"Domain updated during auth test at {unique_suffix()}"
     }
     
-    update_response = requests.put(f"{BASE_URL}/domains/{domain_id}", json=update_data, headers=headers)
+    update_response = SESSION.put(f"{BASE_URL}/domains/{domain_id}", json=update_data, headers=headers)
     
     # Xác minh cập nhật thành công và có trường updated_by
     assert update_response.status_code == 200, f"Update with token should succeed: {update_response.status_code} - {update_response.text}"
-    updated_domain = update_response.json()
+    updated_domain = parse_json(update_response)
     assert "updated_by" in updated_domain, "Response should include updated_by field"
     assert updated_domain["updated_by"] == login_result["user_id"], "updated_by should match the current user ID"
     
     print(f"✅ Update domain with auth test passed for domain ID: {domain_id}")
     
+    # Xóa domain đã tạo trước khi đăng xuất (không cần đăng nhập lại)
+    delete_response = SESSION.delete(f"{BASE_URL}/domains/{domain_id}", headers=headers)
+    assert delete_response.status_code == 200, f"Delete with token should succeed: {delete_response.status_code} - {delete_response.text}"
+    deleted_domain = parse_json(delete_response)
+    assert "deleted_by" in deleted_domain, "Response should include deleted_by field"
+    assert deleted_domain["deleted_by"] == login_result["user_id"], "deleted_by should match the current user ID"
+    
+    print(f"✅ Delete domain with auth test passed for domain ID: {domain_id}")
+    
     # Đăng xuất để thu hồi token
     logout_data = {"token": token}
-    logout_response = requests.post(f"{BASE_URL}/auth/logout", json=logout_data)
+    logout_response = SESSION.post(f"{BASE_URL}/auth/logout", json=logout_data)
     assert logout_response.status_code == 200, "Logout should succeed"
     
-    # Cố gắng cập nhật với token đã thu hồi
+    # Cố gắng cập nhật với token đã thu hồi (xác thực chạy trước khi tìm domain nên trả về 401)
     update_data = {
         "description": "This update should fail due to revoked token"
     }
     
-    invalid_update = requests.put(f"{BASE_URL}/domains/{domain_id}", json=update_data, headers=headers)
+    invalid_update = SESSION.put(f"{BASE_URL}/domains/{domain_id}", json=update_data, headers=headers)
     assert invalid_update.status_code == 401, f"Update with revoked token should fail: {invalid_update.status_code}"
     
     print("✅ Authentication validation test passed")
-    
-    # Đăng nhập lại để xóa domain đã tạo
-    new_response = requests.post(f"{BASE_URL}/auth/login", json=login_data)
-    new_token = new_response.json()["access_token"]
-    new_headers = {"Authorization": f"Bearer {new_token}"}
-    
-    # Xóa domain đã tạo
-    delete_response = requests.delete(f"{BASE_URL}/domains/{domain_id}", headers=new_headers)
-    assert delete_response.status_code == 200, f"Delete with token should succeed: {delete_response.status_code} - {delete_response.text}"
-    deleted_domain = delete_response.json()
-    assert "deleted_by" in deleted_domain, "Response should include deleted_by field"
-    assert deleted_domain["deleted_by"] == login_result["user_id"], "deleted_by should match the current user ID"
-    
-    print(f"✅ Delete domain with auth test passed for domain ID: {domain_id}")
-    
-    return True
 
 def test_disease_auth():
     """
     Test xác thực cho các endpoint disease
     """
-    # Đăng nhập để lấy token
-    
-    response = requests.post(f"{BASE_URL}/auth/login", json=login_data)
-    
-    # Xác minh đăng nhập thành công
-    if response.status_code != 200:
-        print(f"⚠️ Không thể đăng nhập: {response.status_code} - {response.text}")
-        return False
-        
-    login_result = response.json()
-    token = login_result["access_token"]
-    headers = {"Authorization": f"Bearer {token}"}
+    # Dùng token admin dùng chung (test này không đăng xuất)
+    headers = admin_headers()
     
     # Kiểm tra truy cập các endpoint đọc không có token
-    read_response = requests.get(f"{BASE_URL}/diseases")
+    read_response = SESSION.get(f"{BASE_URL}/diseases", params=READ_CHECK_PARAMS)
     assert read_response.status_code == 200, "Read endpoints should be accessible without token"
     
     # Tạo disease với token
     test_disease = {
-        "label": f"Test Auth Disease {uuid.uuid4().hex[:8]}",
+        "label": f"Test Auth Disease {unique_suffix()}",
         "description": "Disease created during auth test",
         "included_in_diagnosis": True
     }
     
-    create_response = requests.post(f"{BASE_URL}/diseases", json=test_disease, headers=headers)
+    create_response = SESSION.post(f"{BASE_URL}/diseases", json=test_disease, headers=headers)
     
     # Xác minh tạo thành công
     assert create_response.status_code == 200, f"Create with token should succeed: {create_response.status_code} - {create_response.text}"
-    created_disease = create_response.json()
+    created_disease = parse_json(create_response)
     
     disease_id = created_disease.get("id")
     print(f"✅ Create disease with auth test passed for disease ID: {disease_id}")
     
     # Kiểm tra cập nhật disease với token
     update_data = {
-        "description": f"Disease updated during auth test at {uuid.uuid4().hex[:8]}"
+        "description": f"Disease updated during auth test at {unique_suffix()}"
     }
     
-    update_response = requests.put(f"{BASE_URL}/diseases/{disease_id}", json=update_data, headers=headers)
+    update_response = SESSION.put(f"{BASE_URL}/diseases/{disease_id}", json=update_data, headers=headers)
     
     # Xác minh cập nhật thành công
     assert update_response.status_code == 200, f"Update with token should succeed: {update_response.status_code} - {update_response.text}"
@@ -221,137 +246,83 @@ def test_disease_auth():
     print(f"✅ Update disease with auth test passed for disease ID: {disease_id}")
     
     # Xóa disease với token
-    delete_response = requests.delete(f"{BASE_URL}/diseases/{disease_id}", headers=headers)
+    delete_response = SESSION.delete(f"{BASE_URL}/diseases/{disease_id}", headers=headers)
     
     # Xác minh xóa thành công
     assert delete_response.status_code == 200, f"Delete with token should succeed: {delete_response.status_code} - {delete_response.text}"
     
     print(f"✅ Delete disease with auth test passed for disease ID: {disease_id}")
-    
-    return True
 
-def test_clinic_article_auth():
+async def _check_crud_auth(client, resource, payload, headers, label):
     """
-    Test xác thực cho các endpoint clinic và article
+    Kiểm tra đọc không cần token, tạo không token bị từ chối, tạo và xóa với token
+    cho một endpoint (clinic hoặc article)
     """
-    # Đăng nhập để lấy token
+    # Đọc không cần token
+    read_response = await client.get(f"{BASE_URL}/{resource}", params=READ_CHECK_PARAMS)
+    assert read_response.status_code == 200, f"{label} read endpoints should be accessible without token"
     
-    response = requests.post(f"{BASE_URL}/auth/login", json=login_data)
+    # Thử tạo không có token
+    no_auth_response = await client.post(f"{BASE_URL}/{resource}", json=payload)
+    assert no_auth_response.status_code in [401, 403], f"Create without token should fail: {no_auth_response.status_code}"
     
-    # Xác minh đăng nhập thành công
-    if response.status_code != 200:
-        print(f"⚠️ Không thể đăng nhập: {response.status_code} - {response.text}")
-        return False
-        
-    login_result = response.json()
-    token = login_result["access_token"]
-    headers = {"Authorization": f"Bearer {token}"}
+    # Tạo với token
+    create_response = await client.post(f"{BASE_URL}/{resource}", json=payload, headers=headers)
+    assert create_response.status_code == 200, f"Create with token should succeed: {create_response.status_code} - {create_response.text}"
+    object_id = parse_json(create_response).get("id")
+    print(f"✅ Create {resource} with auth test passed for {resource} ID: {object_id}")
     
-    # Test clinic - đọc không cần token
-    read_response = requests.get(f"{BASE_URL}/clinic")
-    assert read_response.status_code == 200, "Clinic read endpoints should be accessible without token"
+    # Xóa với token
+    delete_response = await client.delete(f"{BASE_URL}/{resource}/{object_id}", headers=headers)
+    assert delete_response.status_code == 200, f"Delete {resource} with token should succeed"
+
+def test_clinic_article_auth():
+    """
+    Test xác thực cho các endpoint clinic và article
+    """
+    # Dùng token admin dùng chung (test này không đăng xuất)
+    headers = admin_headers()
     
-    # Test clinic - tạo cần token
     test_clinic = {
-        "name": f"Test Auth Clinic {uuid.uuid4().hex[:8]}",
+        "name": f"Test Auth Clinic {unique_suffix()}",
         "description": "Clinic created during auth test",
         "location": "Test Location"
     }
     
-    # Thử tạo clinic không có token
-    no_auth_response = requests.post(f"{BASE_URL}/clinic", json=test_clinic)
-    assert no_auth_response.status_code in [401, 403], f"Create without token should fail: {no_auth_response.status_code}"
-    
-    # Tạo clinic với token
-    create_response = requests.post(f"{BASE_URL}/clinic", json=test_clinic, headers=headers)
-    assert create_response.status_code == 200, f"Create with token should succeed: {create_response.status_code} - {create_response.text}"
-    created_clinic = create_response.json()
-    clinic_id = created_clinic.get("id")
-    print(f"✅ Create clinic with auth test passed for clinic ID: {clinic_id}")
-    
-    # Test article - đọc không cần token
-    read_response = requests.get(f"{BASE_URL}/article")
-    assert read_response.status_code == 200, "Article read endpoints should be accessible without token"
-    
-    # Test article - tạo cần token
     test_article = {
-        "title": f"Test Auth Article {uuid.uuid4().hex[:8]}",
+        "title": f"Test Auth Article {unique_suffix()}",
         "summary": "Article created during auth test",
         "content": "This is test content for authentication testing"
     }
     
-    # Thử tạo article không có token
-    no_auth_response = requests.post(f"{BASE_URL}/article", json=test_article)
-    assert no_auth_response.status_code in [401, 403], f"Create without token should fail: {no_auth_response.status_code}"
-    
-    # Tạo article với token
-    create_response = requests.post(f"{BASE_URL}/article", json=test_article, headers=headers)
-    assert create_response.status_code == 200, f"Create with token should succeed: {create_response.status_code} - {create_response.text}"
-    created_article = create_response.json()
-    article_id = created_article.get("id")
-    print(f"✅ Create article with auth test passed for article ID: {article_id}")
-    
-    # Kiểm tra cập nhật và xóa với token
-    # Xóa article
-    delete_article_response = requests.delete(f"{BASE_URL}/article/{article_id}", headers=headers)
-    assert delete_article_response.status_code == 200, f"Delete article with token should succeed"
+    # Chuỗi thao tác của clinic và article độc lập nên chạy đồng thời
+    async def run_checks():
+        async with httpx.AsyncClient(timeout=30, follow_redirects=True) as client:
+            await asyncio.gather(
+                _check_crud_auth(client, "clinic", test_clinic, headers, "Clinic"),
+                _check_crud_auth(client, "article", test_article, headers, "Article")
+            )
     
-    # Xóa clinic
-    delete_clinic_response = requests.delete(f"{BASE_URL}/clinic/{clinic_id}", headers=headers)
-    assert delete_clinic_response.status_code == 200, f"Delete clinic with token should succeed"
+    asyncio.run(run_checks())
     
     print("✅ Delete operations with auth test passed")
-    
-    return True
+
+# Các test độc lập với nhau (tài nguyên có hậu tố ngẫu nhiên, token thu hồi là token riêng)
+TESTS = {
+    "login_logout": (test_login_logout, "Login/logout"),
+    "domain_auth": (test_domain_auth, "Domain auth"),
+    "disease_auth": (test_disease_auth, "Disease auth"),
+    "clinic_article_auth": (test_clinic_article_auth, "Clinic/article auth"),
+}
 
 if __name__ == "__main__":
-    # Tạo thư mục để lưu kết quả
-    Path("tests/results").mkdir(parents=True, exist_ok=True)
-    
-    # Chạy tests
-    results = {}
-    
-    try:
-        if test_login_logout():
-            results["login_logout"] = {"status": "passed"}
-        else:
-            results["login_logout"] = {"status": "failed", "error": "Failed to complete login/logout test"}
-    except Exception as e:
-        results["login_logout"] = {"status": "failed", "error": str(e)}
-        print(f"❌ Login/logout test failed: {str(e)}")
-    
-    try:
-        if test_domain_auth():
-            results["domain_auth"] = {"status": "passed"}
-        else:
-            results["domain_auth"] = {"status": "failed", "error": "Failed to complete domain auth test"}
-    except Exception as e:
-        results["domain_auth"] = {"status": "failed", "error": str(e)}
-        print(f"❌ Domain auth test failed: {str(e)}")
-    
-    try:
-        if test_disease_auth():
-            results["disease_auth"] = {"status": "passed"}
-        else:
-            results["disease_auth"] = {"status": "failed", "error": "Failed to complete disease auth test"}
-    except Exception as e:
-        results["disease_auth"] = {"status": "failed", "error": str(e)}
-        print(f"❌ Disease auth test failed: {str(e)}")
-    
-    try:
-        if test_clinic_article_auth():
-            results["clinic_article_auth"] = {"status": "passed"}
-        else:
-            results["clinic_article_auth"] = {"status": "failed", "error": "Failed to complete clinic/article auth test"}
-    except Exception as e:
-        results["clinic_article_auth"] = {"status": "failed", "error": str(e)}
-        print(f"❌ Clinic/article auth test failed: {str(e)}")
+    # Chạy song song các tests, thời gian chủ yếu là chờ mạng
+    results = run_tests(TESTS)
     
     # Lưu kết quả tests
     results["timestamp"] = str(Path(__file__).stat().st_mtime)
     
-    with open("tests/results/auth_test_result.json", "w", encoding="utf-8") as f:
-        json.dump(results, f, indent=2)
+    save_result("auth_test_result.json", results)
     
     # Kiểm tra kết quả tổng thể
     if all(test["status"] == "passed" for test in results.values() if isinstance(test, dict)):
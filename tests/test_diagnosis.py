@@ -1,29 +1,38 @@
-import requests
-import json
+import orjson
 import os
-import base64
+# Mã hóa base64 bằng SIMD nếu có pybase64
+try:
+    import pybase64 as base64
+except ImportError:
+    import base64
+import functools
 from pathlib import Path
+try:
+    from ._util import make_session, run_tests, save_result
+except ImportError:
+    from _util import make_session, run_tests, save_result
 from typing import Optional
 
 # Cấu hình API endpoint
 BASE_URL = os.environ.get("API_BASE_URL", "http://localhost:8100/api")
 
-def load_test_image(image_path: str = None) -> Optional[str]:
+# Body được gửi dạng bytes orjson nên đặt sẵn Content-Type JSON
+SESSION = make_session(pool_maxsize=8, headers={"Content-Type": "application/json"})
+
+@functools.lru_cache(maxsize=4)
+def load_test_image(image_path: str = "test_image.jpg") -> Optional[str]:
     """
-    Tải ảnh test và mã hóa base64
+    Tải ảnh test và mã hóa base64 (kết quả được cache theo đường dẫn
+    để các test dùng chung ảnh không phải đọc và mã hóa lại)
     """
-    # Sử dụng ảnh mặc định nếu không có đường dẫn
-    if not image_path:
-        image_path = "test_image.jpg"
-    
-    # Kiểm tra file tồn tại
-    if not Path(image_path).exists():
+    # Đọc và mã hóa ảnh
+    try:
+        data = Path(image_path).read_bytes()
+    except FileNotFoundError:
         print(f"Warning: Test image not found at {image_path}")
         return None
     
-    # Đọc và mã hóa ảnh
-    with open(image_path, "rb") as img_file:
-        return base64.b64encode(img_file.read()).decode("utf-8")
+    return base64.b64encode(data).decode("ascii")
 
 def test_diagnosis_text_only():
     """
@@ -36,7 +45,7 @@ def test_diagnosis_text_only():
     }
     
     # Gửi request
-    response = requests.post(f"{BASE_URL}/diagnosis/analyze", json=payload)
+    response = SESSION.post(f"{BASE_URL}/diagnosis/analyze", data=orjson.dumps(payload))
     
     # Kiểm tra status code
     assert response.status_code == 200, f"Expected status code 200 but got {response.status_code}"
@@ -71,7 +80,7 @@ def test_diagnosis_image_only():
     }
     
     # Gửi request
-    response = requests.post(f"{BASE_URL}/diagnosis/image-only", json=payload)
+    response = SESSION.post(f"{BASE_URL}/diagnosis/image-only", data=orjson.dumps(payload))
     
     # Kiểm tra status code
     assert response.status_code == 200, f"Expected status code 200 but got {response.status_code}"
@@ -98,7 +107,7 @@ def test_get_context():
     }
     
     # Gửi request
-    response = requests.post(f"{BASE_URL}/diagnosis/context", json=payload)
+    response = SESSION.post(f"{BASE_URL}/diagnosis/context", data=orjson.dumps(payload))
     
     # Kiểm tra status code
     assert response.status_code == 200, f"Expected status code 200 but got {response.status_code}"
@@ -131,7 +140,7 @@ def test_combined_diagnosis():
     }
     
     # Gửi request
-    response = requests.post(f"{BASE_URL}/diagnosis/analyze", json=payload)
+    response = SESSION.post(f"{BASE_URL}/diagnosis/analyze", data=orjson.dumps(payload))
     
     # Kiểm tra status code
     assert response.status_code == 200, f"Expected status code 200 but got {response.status_code}"
@@ -143,50 +152,22 @@ def test_combined_diagnosis():
     
     print("✅ Combined diagnosis test passed")
 
+# Các test độc lập với nhau, thời gian chủ yếu là chờ dịch vụ chẩn đoán
+TESTS = {
+    "text_only_diagnosis": (test_diagnosis_text_only, "Text-only diagnosis"),
+    "get_context": (test_get_context, "Get context"),
+    "image_only_diagnosis": (test_diagnosis_image_only, "Image-only diagnosis"),
+    "combined_diagnosis": (test_combined_diagnosis, "Combined diagnosis"),
+}
+
 if __name__ == "__main__":
-    # Tạo thư mục để lưu kết quả
-    Path("tests/results").mkdir(parents=True, exist_ok=True)
-    
-    # Chạy tests
-    results = {}
-    
-    try:
-        # Test chẩn đoán chỉ với text
-        test_diagnosis_text_only()
-        results["text_only_diagnosis"] = {"status": "passed"}
-    except Exception as e:
-        results["text_only_diagnosis"] = {"status": "failed", "error": str(e)}
-        print(f"❌ Text-only diagnosis test failed: {str(e)}")
-    
-    try:
-        # Test lấy context
-        test_get_context()
-        results["get_context"] = {"status": "passed"}
-    except Exception as e:
-        results["get_context"] = {"status": "failed", "error": str(e)}
-        print(f"❌ Get context test failed: {str(e)}")
-    
-    try:
-        # Test chẩn đoán chỉ với ảnh
-        test_diagnosis_image_only()
-        results["image_only_diagnosis"] = {"status": "passed"}
-    except Exception as e:
-        results["image_only_diagnosis"] = {"status": "failed", "error": str(e)}
-        print(f"❌ Image-only diagnosis test failed: {str(e)}")
-    
-    try:
-        # Test chẩn đoán với cả text và ảnh
-        test_combined_diagnosis()
-        results["combined_diagnosis"] = {"status": "passed"}
-    except Exception as e:
-        results["combined_diagnosis"] = {"status": "failed", "error": str(e)}
-        print(f"❌ Combined diagnosis test failed: {str(e)}")
+    # Chạy song song các tests
+    results = run_tests(TESTS)
     
     # Lưu kết quả tests
     results["timestamp"] = str(Path(__file__).stat().st_mtime)
     
-    with open("tests/results/diagnosis_test_result.json", "w", encoding="utf-8") as f:
-        json.dump(results, f, indent=2)
+    save_result("diagnosis_test_result.json", results)
     
     # Kiểm tra kết quả tổng thể
     if all(test["status"] == "passed" for test in results.values() if isinstance(test, dict)):
@@ -6,14 +6,13 @@ Sử dụng database và microservices APIs
 """
 import os
 import sys
-import json
+import orjson
 import asyncio
-import random
 import time
 import base64
 import uuid
 import sqlite3
-import requests
+import httpx
 from pathlib import Path
 from typing import Dict, List, Any, Optional, Tuple
 import numpy as np
@@ -27,31 +26,44 @@ from tqdm import tqdm
 # Thêm thư mục gốc vào sys.path để import các module từ app
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# Import các service functions trực tiếp
-from app.services.diagnosis_service import (
-    get_first_stage_diagnosis_v3, 
-    get_second_stage_diagnosis_v3
-)
+# Service chẩn đoán và chromadb_instance kéo theo toàn bộ model stack,
+# chỉ import khi thực sự chạy test (xem load_database_connections/process_single_diagnosis)
 from app.core.logging import logger
-from app.db.chromadb_service import chromadb_instance
 
-# Environment variables cho microservices
-os.environ["IMAGE_COLLECTION"] = "test-image-collection-cs"
-os.environ["SQLITE_DB_PATH"] = "runtime/db3.sqlite3"
-os.environ["CHROMA_HOST"] = "localhost"
-os.environ["CHROMA_PORT"] = "8129"
-os.environ["IMAGE_EMBEDDING_URL"] = "http://localhost:8126"
-os.environ["IMAGE_EMBEDDING_API_KEY"] = "sk-proj-19Hn2k4napelkmbalkw84nb2j4k2lm6b0"
+# Environment variables cho microservices, chỉ đặt khi chạy test (xem apply_test_env),
+# không đặt lúc import để không ảnh hưởng process đang import module này
+TEST_ENV = {
+    "IMAGE_COLLECTION": "test-image-collection-cs",
+    "SQLITE_DB_PATH": "runtime/db3.sqlite3",
+    "CHROMA_HOST": "localhost",
+    "CHROMA_PORT": "8129",
+    "IMAGE_EMBEDDING_URL": "http://localhost:8126",
+    "IMAGE_EMBEDDING_API_KEY": "sk-proj-19Hn2k4napelkmbalkw84nb2j4k2lm6b0",
+}
+
+def apply_test_env():
+    """
+    Đặt các biến môi trường của microservices cho test, gọi trước khi khởi tạo tester
+    """
+    os.environ.update(TEST_ENV)
+
+# Số sample image tạo sẵn khi khởi tạo tester
+SAMPLE_IMAGE_POOL_SIZE = 4
 
 class DatabaseDiagnosisPipelineTester:
     """
     Class test pipeline chẩn đoán sử dụng database và microservices
     """
     
-    def __init__(self, num_samples: int = 5):
+    def __init__(self, num_samples: int = 5, concurrency: int = 4):
         self.num_samples = num_samples
+        self.concurrency = concurrency
         self.results = []
         self.failed_samples = []
+        self._standard_domain_id = None
+        
+        # Bộ sinh số ngẫu nhiên NumPy, chọn index theo batch thay vì từng phần tử
+        self._rng = np.random.default_rng()
         
         # Microservices configurations
         self.image_collection = os.getenv("IMAGE_COLLECTION")
@@ -61,9 +73,25 @@ class DatabaseDiagnosisPipelineTester:
         self.embedding_url = os.getenv("IMAGE_EMBEDDING_URL")
         self.embedding_api_key = os.getenv("IMAGE_EMBEDDING_API_KEY")
         
+        # Client bất đồng bộ dùng chung cho embedding API (giữ kết nối keep-alive
+        # giữa các sample và không chặn event loop khi các sample chạy đồng thời)
+        self.http = httpx.AsyncClient(
+            timeout=30,
+            limits=httpx.Limits(max_connections=16),
+            headers={
+                "Authorization": f"Bearer {self.embedding_api_key}",
+                "Content-Type": "application/json"
+            }
+        )
+        
         # Load databases
         self.load_database_connections()
         
+        # Tạo sẵn một pool nhỏ sample image base64, dùng xoay vòng cho các sample
+        self._sample_image_pool = [
+            self.create_sample_image_base64() for _ in range(SAMPLE_IMAGE_POOL_SIZE)
+        ]
+        
     def load_database_connections(self):
         """Khởi tạo kết nối database"""
         logger.app_info("Initializing database connections")
@@ -71,16 +99,21 @@ class DatabaseDiagnosisPipelineTester:
         # SQLite connection
         try:
             self.sqlite_conn = sqlite3.connect(self.sqlite_db_path)
-            self.sqlite_conn.row_factory = sqlite3.Row  # Để truy cập columns theo tên
+            # Tăng page cache và dùng mmap cho các truy vấn đọc của test
+            self.sqlite_conn.executescript("PRAGMA cache_size=-65536; PRAGMA mmap_size=268435456;")
             logger.app_info(f"SQLite connected: {self.sqlite_db_path}")
         except Exception as e:
             logger.error(f"SQLite connection failed: {str(e)}")
             self.sqlite_conn = None
         
         # ChromaDB connection sẽ sử dụng chromadb_instance đã có
+        self.chromadb = None
         try:
+            from app.db.chromadb_service import chromadb_instance
+            self.chromadb = chromadb_instance
+            
             # Test ChromaDB connection
-            collections = chromadb_instance.client.list_collections()
+            collections = self.chromadb.client.list_collections()
             logger.app_info(f"ChromaDB connected, collections: {[c.name for c in collections]}")
         except Exception as e:
             logger.error(f"ChromaDB connection failed: {str(e)}")
@@ -94,20 +127,23 @@ class DatabaseDiagnosisPipelineTester:
         try:
             cursor = self.sqlite_conn.cursor()
             
-            # Lấy domain STANDARD
-            cursor.execute("""
-                SELECT id FROM domains 
-                WHERE domain LIKE 'STANDARD%' AND deleted_at IS NULL
-                LIMIT 1
-            """)
-            domain_row = cursor.fetchone()
-            
-            if not domain_row:
-                logger.error("STANDARD domain not found in database")
-                return []
+            # Lấy domain STANDARD (chỉ truy vấn một lần cho mỗi tester)
+            if self._standard_domain_id is None:
+                cursor.execute("""
+                    SELECT id FROM domains 
+                    WHERE domain LIKE 'STANDARD%' AND deleted_at IS NULL
+                    LIMIT 1
+                """)
+                domain_row = cursor.fetchone()
+                
+                if not domain_row:
+                    logger.error("STANDARD domain not found in database")
+                    return []
+                
+                self._standard_domain_id = domain_row[0]
+                logger.app_info(f"Found STANDARD domain: {self._standard_domain_id}")
             
-            domain_id = domain_row['id']
-            logger.app_info(f"Found STANDARD domain: {domain_id}")
+            domain_id = self._standard_domain_id
             
             # Lấy tất cả diseases trong domain STANDARD
             cursor.execute("""
@@ -117,7 +153,10 @@ class DatabaseDiagnosisPipelineTester:
                 ORDER BY label
             """, (domain_id,))
             
-            diseases = [dict(row) for row in cursor.fetchall()]
+            diseases = [
+                {'id': disease_id, 'label': label, 'description': description}
+                for disease_id, label, description in cursor
+            ]
             logger.app_info(f"Found {len(diseases)} diseases in STANDARD domain")
             
             return diseases
@@ -134,30 +173,43 @@ class DatabaseDiagnosisPipelineTester:
         try:
             # Lấy random images từ ChromaDB
             # ChromaDB không có built-in random, nên ta sẽ lấy một batch và chọn random
-            collection = chromadb_instance.image_caption_collection
+            collection = self.chromadb.image_caption_collection
             
-            # Lấy tất cả IDs trước
-            all_data = collection.get(
+            # Lấy tất cả IDs trước (chỉ IDs, không kèm metadata/document)
+            all_ids = collection.get(
                 limit=1000,  # Giới hạn để không overload
-                include=["metadatas", "documents"]
-            )
+                include=[]
+            )["ids"]
             
-            if not all_data["ids"]:
+            if not all_ids:
                 logger.error("No images found in ChromaDB collection")
                 return []
             
-            logger.app_info(f"Found {len(all_data['ids'])} images in ChromaDB")
+            logger.app_info(f"Found {len(all_ids)} images in ChromaDB")
             
-            # Chọn random images
-            total_images = len(all_data["ids"])
-            selected_indices = random.sample(range(total_images), min(num_images, total_images))
+            # Chọn random images rồi chỉ lấy metadata/document của các ID đã chọn
+            selected_idx = self._rng.choice(len(all_ids), size=min(num_images, len(all_ids)), replace=False)
+            selected_ids = [all_ids[idx] for idx in selected_idx.tolist()]
+            selected_data = collection.get(
+                ids=selected_ids,
+                include=["metadatas", "documents"]
+            )
+            
+            # ChromaDB không đảm bảo thứ tự trả về, tra cứu theo ID để giữ thứ tự đã chọn
+            metadatas = selected_data["metadatas"] or [{}] * len(selected_data["ids"])
+            documents = selected_data["documents"] or [""] * len(selected_data["ids"])
+            rows_by_id = {
+                image_id: (metadata, document)
+                for image_id, metadata, document in zip(selected_data["ids"], metadatas, documents)
+            }
             
             selected_images = []
-            for idx in selected_indices:
+            for image_id in selected_ids:
+                metadata, document = rows_by_id.get(image_id, ({}, ""))
                 image_data = {
-                    'id': all_data["ids"][idx],
-                    'metadata': all_data["metadatas"][idx] if all_data["metadatas"] else {},
-                    'document': all_data["documents"][idx] if all_data["documents"] else ""
+                    'id': image_id,
+                    'metadata': metadata,
+                    'document': document
                 }
                 selected_images.append(image_data)
             
@@ -168,16 +220,11 @@ class DatabaseDiagnosisPipelineTester:
             logger.error(f"Error getting images from ChromaDB: {str(e)}")
             return []
     
-    def generate_image_description_with_embedding_api(self, image_base64: str) -> str:
+    async def generate_image_description_with_embedding_api(self, image_base64: str) -> str:
         """
         Sử dụng embedding API để tạo mô tả hình ảnh
         """
         try:
-            headers = {
-                "Authorization": f"Bearer {self.embedding_api_key}",
-                "Content-Type": "application/json"
-            }
-            
             payload = {
                 "model": "vision-description",
                 "input": {
@@ -186,11 +233,9 @@ class DatabaseDiagnosisPipelineTester:
                 }
             }
             
-            response = requests.post(
+            response = await self.http.post(
                 f"{self.embedding_url}/v1/descriptions",
-                headers=headers,
-                json=payload,
-                timeout=30
+                content=orjson.dumps(payload)
             )
             
             if response.status_code == 200:
@@ -211,19 +256,18 @@ class DatabaseDiagnosisPipelineTester:
         Tạo sample image base64 để test (vì ChromaDB chỉ chứa metadata)
         """
         try:
-            # Tạo ảnh sample màu random
-            color = (random.randint(100, 255), random.randint(100, 255), random.randint(100, 255))
-            img = Image.new('RGB', (width, height), color)
-            
-            # Thêm một số noise để giống ảnh thật hơn
-            pixels = np.array(img)
-            noise = np.random.randint(-30, 30, pixels.shape, dtype=np.int16)
-            pixels = np.clip(pixels.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+            # Tạo ảnh sample màu random trực tiếp bằng NumPy, thêm noise [-30, 30) để giống ảnh thật hơn.
+            # Làm hoàn toàn trên một buffer uint8: chặn noise trước để color - 30 + noise <= 255
+            color = self._rng.integers(100, 256, 3, dtype=np.uint8)
+            pixels = self._rng.integers(0, 60, (height, width, 3), dtype=np.uint8)
+            np.minimum(pixels, 255 - color + 30, out=pixels)
+            np.add(pixels, color - 30, out=pixels)
             img = Image.fromarray(pixels)
             
-            # Convert to base64
+            # Convert to base64 (JPEG: nhanh hơn PNG với ảnh nhiễu và đúng định dạng
+            # mà image encoding server ưu tiên)
             buffer = io.BytesIO()
-            img.save(buffer, format="PNG")
+            img.save(buffer, format="JPEG", quality=85)
             return base64.b64encode(buffer.getvalue()).decode('utf-8')
             
         except Exception as e:
@@ -246,15 +290,16 @@ class DatabaseDiagnosisPipelineTester:
             logger.error("No images found in ChromaDB")
             return []
         
-        # Kết hợp diseases và images
+        # Kết hợp diseases và images (chọn random disease cho tất cả sample một lần)
+        num_selected = min(self.num_samples, len(images))
+        disease_idx = self._rng.integers(0, len(diseases), size=num_selected).tolist()
         selected_samples = []
-        for i in range(min(self.num_samples, len(images))):
-            # Chọn random disease
-            disease = random.choice(diseases)
+        for i in range(num_selected):
+            disease = diseases[disease_idx[i]]
             image = images[i]
             
-            # Tạo sample image base64 để test
-            sample_image_base64 = self.create_sample_image_base64()
+            # Lấy sample image base64 từ pool đã tạo sẵn
+            sample_image_base64 = self._sample_image_pool[i % len(self._sample_image_pool)]
             
             sample = {
                 'index': i,
@@ -271,14 +316,25 @@ class DatabaseDiagnosisPipelineTester:
         logger.app_info(f"Selected {len(selected_samples)} test samples")
         return selected_samples
     
-    async def process_single_diagnosis(self, item: Dict[str, Any]) -> Dict[str, Any]:
+    async def process_single_diagnosis(self, item: Dict[str, Any],
+                                       description_task: Optional[asyncio.Task] = None) -> Dict[str, Any]:
         """
         Xử lý chẩn đoán cho một sample
+        
+        description_task: task tạo mô tả đã được khởi chạy trước bởi caller (prefetch);
+        nếu không có thì gọi embedding API ngay tại đây
         """
+        from app.services.diagnosis_service import (
+            get_first_stage_diagnosis_v3,
+            get_second_stage_diagnosis_v3
+        )
+        
         try:
-            # Tạo mô tả bằng embedding API
-            logger.app_info(f"Generating description for sample {item['index']}")
-            description = self.generate_image_description_with_embedding_api(item['sample_image_base64'])
+            # Tạo mô tả bằng embedding API (hoặc chờ kết quả đã prefetch)
+            if description_task is None:
+                logger.app_info(f"Generating description for sample {item['index']}")
+                description_task = self.generate_image_description_with_embedding_api(item['sample_image_base64'])
+            description = await description_task
             
             # Gọi trực tiếp service function thay vì API
             logger.app_info(f"Running diagnosis pipeline for sample {item['index']}")
@@ -315,9 +371,7 @@ class DatabaseDiagnosisPipelineTester:
             return result
             
         except Exception as e:
-            logger.error(f"Error processing sample {item['index']}: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error processing sample %d: %s", item['index'], e)
             
             return {
                 'sample_index': item['index'],
@@ -344,17 +398,28 @@ class DatabaseDiagnosisPipelineTester:
                 'results': []
             }
         
-        # Xử lý từng sample
-        results = []
-        for i, sample in enumerate(selected_samples):
-            logger.app_info(f"Processing sample {i+1}/{len(selected_samples)}")
-            
-            # Thêm delay để tránh overload
-            if i > 0:
-                await asyncio.sleep(2)
-                
-            result = await self.process_single_diagnosis(sample)
-            results.append(result)
+        # Xử lý các sample đồng thời, giới hạn số sample chạy cùng lúc để tránh overload
+        semaphore = asyncio.Semaphore(self.concurrency)
+        
+        # Semaphore riêng cho embedding API: việc prefetch mô tả cũng chỉ gửi tối đa
+        # `concurrency` request cùng lúc, không dồn toàn bộ sample vào embedding API
+        description_semaphore = asyncio.Semaphore(self.concurrency)
+        
+        async def describe(sample: Dict[str, Any]) -> str:
+            async with description_semaphore:
+                return await self.generate_image_description_with_embedding_api(sample['sample_image_base64'])
+        
+        async def run_sample(i: int, sample: Dict[str, Any]) -> Dict[str, Any]:
+            # Prefetch mô tả từ embedding API trước khi chờ semaphore, để độ trễ của
+            # embedding API được che bởi các stage LLM của những sample đang chạy
+            description_task = asyncio.create_task(describe(sample))
+            async with semaphore:
+                logger.app_info(f"Processing sample {i+1}/{len(selected_samples)}")
+                return await self.process_single_diagnosis(sample, description_task)
+        
+        results = await asyncio.gather(
+            *(run_sample(i, sample) for i, sample in enumerate(selected_samples))
+        )
         
         # Tính toán thống kê
         successful_results = [r for r in results if r['success']]
@@ -396,20 +461,17 @@ class DatabaseDiagnosisPipelineTester:
                 'embedding_api_url': self.embedding_url
             },
             'stats': test_results.get('stats', {}),
-            'results': []
+            # Kết quả của process_single_diagnosis không chứa ảnh base64 nên ghi trực tiếp
+            'results': test_results.get('results', [])
         }
         
-        # Process results for saving
-        for result in test_results.get('results', []):
-            save_result = result.copy()
-            # Remove long base64 strings to save space
-            if 'sample_image_base64' in save_result:
-                save_result['sample_image_base64'] = f"[BASE64_IMAGE_{len(save_result.get('sample_image_base64', ''))}]"
-            save_data['results'].append(save_result)
-        
         # Save to file
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(save_data, f, ensure_ascii=False, indent=2)
+        with open(output_file, 'wb') as f:
+            f.write(orjson.dumps(
+                save_data,
+                option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS,
+                default=str
+            ))
         
         logger.app_info(f"Test results saved to {output_file}")
         
@@ -431,6 +493,16 @@ class DatabaseDiagnosisPipelineTester:
         else:
             print(f"Test failed: {test_results.get('error', 'Unknown error')}")
     
+    async def aclose(self):
+        """Đóng HTTP client của embedding API"""
+        await self.http.aclose()
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+    
     def __del__(self):
         """Cleanup database connections"""
         if hasattr(self, 'sqlite_conn') and self.sqlite_conn:
@@ -445,27 +517,28 @@ async def main():
     parser = argparse.ArgumentParser(description='Test diagnosis pipeline with database')
     parser.add_argument('--samples', type=int, default=3, help='Number of samples to test')
     parser.add_argument('--output', type=str, help='Output file path')
+    parser.add_argument('--concurrency', type=int, default=4, help='Maximum number of samples processed at once')
     
     args = parser.parse_args()
+    apply_test_env()
     
-    # Khởi tạo tester
-    tester = DatabaseDiagnosisPipelineTester(num_samples=args.samples)
-    
-    try:
-        # Chạy test
-        logger.app_info("Starting database diagnosis pipeline test")
-        test_results = await tester.run_diagnosis_tests()
-        
-        # Lưu kết quả
-        tester.save_results(test_results, args.output)
-        
-        return test_results['stats']['success_rate'] > 0.5 if test_results.get('success') else False
-        
-    except Exception as e:
-        logger.error(f"Test failed with error: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return False
+    # Khởi tạo tester (async with đóng HTTP client khi kết thúc)
+    async with DatabaseDiagnosisPipelineTester(num_samples=args.samples, concurrency=args.concurrency) as tester:
+        try:
+            # Chạy test
+            logger.app_info("Starting database diagnosis pipeline test")
+            test_results = await tester.run_diagnosis_tests()
+            
+            # Lưu kết quả
+            tester.save_results(test_results, args.output)
+            
+            return test_results['stats']['success_rate'] > 0.5 if test_results.get('success') else False
+            
+        except Exception as e:
+            logger.error(f"Test failed with error: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            return False
 
 if __name__ == "__main__":
     # Chạy test
@@ -1,19 +1,97 @@
-import requests
+import asyncio
+import httpx
 import json
 import os
 import uuid
+import hashlib
 from pathlib import Path
 from datetime import datetime
+try:
+    from ._util import save_result
+except ImportError:
+    from _util import save_result
 
 # Cấu hình API endpoint
 BASE_URL = os.environ.get("API_BASE_URL", "http://localhost:8100/api")
 
-def test_get_domains():
+# Thời điểm sửa đổi file test (dùng làm timestamp kết quả), đọc một lần khi import
+_MTIME = str(Path(__file__).stat().st_mtime)
+
+# URL các endpoint, dựng sẵn một lần
+DOMAINS_URL = f"{BASE_URL}/domains"
+DOMAIN_BY_ID = DOMAINS_URL + "/{}"
+DELETE_TMPL = DOMAINS_URL + "/{id}?soft_delete=true&deleted_by={user}"
+
+def create_client():
+    """
+    Tạo client bất đồng bộ dùng chung cho các test, để chuỗi POST -> PUT -> DELETE và các GET
+    tái sử dụng kết nối keep-alive (API chạy trên uvicorn chỉ hỗ trợ HTTP/1.1 nên không bật http2)
+    """
+    return httpx.AsyncClient(
+        transport=httpx.AsyncHTTPTransport(retries=2),
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+        timeout=30.0
+    )
+
+# Chế độ chạy các test đọc: wild (gọi API thật), record (gọi API thật và lưu response
+# vào tests/fixtures), replay (đọc lại response đã lưu, không cần mạng)
+TEST_MODE = os.environ.get("TEST_MODE", "wild")
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+class ReplayResponse:
+    """
+    Response đọc lại từ fixture, có các thuộc tính mà test sử dụng
+    """
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self._data = data
+    
+    def json(self):
+        return self._data
+
+def fixture_path(method, url, body=None):
+    """
+    Đường dẫn fixture, khóa theo method + đường dẫn (không kèm BASE_URL) + hash body
+    """
+    path = url[len(BASE_URL):] if url.startswith(BASE_URL) else url
+    key = hashlib.sha256(f"{method} {path} {body or ''}".encode()).hexdigest()[:16]
+    return FIXTURES_DIR / f"{method.lower()}_{key}.json"
+
+async def api_get(client, url):
+    """
+    GET qua client, hoặc ghi/đọc fixture tùy theo TEST_MODE
+    """
+    path = fixture_path("GET", url)
+    if TEST_MODE == "replay":
+        fixture = json.loads(path.read_text(encoding="utf-8"))
+        return ReplayResponse(fixture["status_code"], fixture["json"])
+    
+    response = await client.get(url)
+    if TEST_MODE == "record":
+        FIXTURES_DIR.mkdir(parents=True, exist_ok=True)
+        fixture = {"url": url, "status_code": response.status_code, "json": response.json()}
+        path.write_text(json.dumps(fixture, indent=2, ensure_ascii=False), encoding="utf-8")
+    return response
+
+# Task GET /domains dùng chung: _check_get_domains và _check_get_domain_by_id chạy đồng thời
+# nên cache task (không phải kết quả) để cả hai cùng chờ một request duy nhất
+_domains_task = None
+
+async def get_domains_response(client):
+    """
+    Lấy response GET /domains, chỉ gửi request một lần cho cả lần chạy
+    """
+    global _domains_task
+    if _domains_task is None:
+        _domains_task = asyncio.ensure_future(api_get(client, DOMAINS_URL))
+    return await _domains_task
+
+async def _check_get_domains(client):
     """
     Test endpoint lấy danh sách lĩnh vực y tế
     """
     # Gửi request
-    response = requests.get(f"{BASE_URL}/domains")
+    response = await get_domains_response(client)
     
     # Kiểm tra status code
     assert response.status_code == 200, f"Expected status code 200 but got {response.status_code}"
@@ -34,12 +112,12 @@ def test_get_domains():
     
     print(f"✅ Get domains test passed, found {len(data)} domains")
 
-def test_get_domain_by_id():
+async def _check_get_domain_by_id(client):
     """
     Test endpoint lấy thông tin chi tiết của một lĩnh vực y tế
     """
     # Trước tiên lấy danh sách domain để có ID mẫu
-    response = requests.get(f"{BASE_URL}/domains")
+    response = await get_domains_response(client)
     assert response.status_code == 200, "Failed to get domains list"
     
     domains = response.json()
@@ -51,7 +129,7 @@ def test_get_domain_by_id():
     domain_id = domains[0]["id"]
     
     # Gửi request lấy chi tiết domain
-    response = requests.get(f"{BASE_URL}/domains/{domain_id}")
+    response = await api_get(client, DOMAIN_BY_ID.format(domain_id))
     
     # Kiểm tra status code
     assert response.status_code == 200, f"Expected status code 200 but got {response.status_code}"
@@ -69,13 +147,22 @@ def test_get_domain_by_id():
     
     print(f"✅ Get domain by ID test passed for domain ID: {domain_id}")
 
-def test_create_and_update_domain():
+async def _check_create_and_update_domain(client):
     """
     Test endpoints tạo và cập nhật lĩnh vực y tế (CRUD operations)
     """
+    # Payload chứa uuid mới mỗi lần chạy nên không thể replay
+    if TEST_MODE == "replay":
+        print("⚠️ Skipping create/update/delete domain test in replay mode")
+        return True
+    
     # Dữ liệu mẫu để tạo domain mới
+    # Lấy thời gian và uuid một lần, các user tạo/cập nhật/xóa dùng các đoạn khác nhau của cùng uuid
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    test_user = f"test_user_{uuid.uuid4().hex[:8]}"
+    rand_suffix = uuid.uuid4().hex
+    test_user = f"test_user_{rand_suffix[:8]}"
+    updated_user = f"updated_user_{rand_suffix[8:16]}"
+    deleted_user = f"deleted_user_{rand_suffix[16:24]}"
     test_domain = {
         "domain": f"This is a test domain {now}",
         "description": f"This is a test domain created by automated testing at {now}",
@@ -84,7 +171,7 @@ def test_create_and_update_domain():
     
     try:
         # Gửi request tạo domain mới
-        create_response = requests.post(f"{BASE_URL}/domains", json=test_domain)
+        create_response = await client.post(DOMAINS_URL, json=test_domain)
         
         # Kiểm tra status code
         assert create_response.status_code == 200, f"Expected status code 200 but got {create_response.status_code}"
@@ -105,15 +192,13 @@ def test_create_and_update_domain():
         print(f"✅ Create domain test passed, created domain with ID: {domain_id}")
         
         # Test cập nhật domain
-        update_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        updated_user = f"updated_user_{uuid.uuid4().hex[:8]}"
         update_data = {
-            "domain": f"Updated {test_domain['domain']} at {update_time}",
-            "description": f"Updated description by automated testing at {update_time}",
+            "domain": f"Updated {test_domain['domain']} at {now}",
+            "description": f"Updated description by automated testing at {now}",
             "updated_by": updated_user
         }
         
-        update_response = requests.put(f"{BASE_URL}/domains/{domain_id}", json=update_data)
+        update_response = await client.put(DOMAIN_BY_ID.format(domain_id), json=update_data)
         
         # Kiểm tra status code
         assert update_response.status_code == 200, f"Expected status code 200 but got {update_response.status_code}"
@@ -127,8 +212,7 @@ def test_create_and_update_domain():
         print(f"✅ Update domain test passed for domain ID: {domain_id}")
         
         # Test xóa domain (soft delete) với người xóa
-        deleted_user = f"deleted_user_{uuid.uuid4().hex[:8]}"
-        delete_response = requests.delete(f"{BASE_URL}/domains/{domain_id}?soft_delete=true&deleted_by={deleted_user}")
+        delete_response = await client.delete(DELETE_TMPL.format(id=domain_id, user=deleted_user))
         
         # Kiểm tra status code
         assert delete_response.status_code == 200, f"Expected status code 200 but got {delete_response.status_code}"
@@ -146,44 +230,74 @@ def test_create_and_update_domain():
         print(f"❌ Create/update/delete domain test failed: {str(e)}")
         return False
 
-if __name__ == "__main__":
-    # Tạo thư mục để lưu kết quả
-    Path("tests/results").mkdir(parents=True, exist_ok=True)
+def run_check(check):
+    """
+    Chạy một check bất đồng bộ trên client riêng, dùng cho các test_* chạy độc lập (vd. pytest)
+    """
+    async def run():
+        async with create_client() as client:
+            return await check(client)
     
+    return asyncio.run(run())
+
+def test_get_domains():
+    """
+    Test endpoint lấy danh sách lĩnh vực y tế
+    """
+    run_check(_check_get_domains)
+
+def test_get_domain_by_id():
+    """
+    Test endpoint lấy thông tin chi tiết của một lĩnh vực y tế
+    """
+    run_check(_check_get_domain_by_id)
+
+def test_create_and_update_domain():
+    """
+    Test endpoints tạo, cập nhật và xóa lĩnh vực y tế (CRUD operations)
+    """
+    assert run_check(_check_create_and_update_domain), "Failed to complete CRUD operations"
+
+def record_result(results, key, outcome, label):
+    """
+    Ghi kết quả một test (giá trị trả về hoặc exception từ asyncio.gather) vào results
+    """
+    if isinstance(outcome, BaseException):
+        results[key] = {"status": "failed", "error": str(outcome)}
+        print(f"❌ {label} test failed: {str(outcome)}")
+    elif outcome is False:
+        results[key] = {"status": "failed", "error": "Failed to complete CRUD operations"}
+    else:
+        results[key] = {"status": "passed"}
+
+async def run_all():
+    """
+    Chạy đồng thời các test trên một client dùng chung (các test đọc độc lập với test CRUD)
+    """
+    async with create_client() as client:
+        return await asyncio.gather(
+            _check_get_domains(client),
+            _check_get_domain_by_id(client),
+            _check_create_and_update_domain(client),
+            return_exceptions=True
+        )
+
+if __name__ == "__main__":
     # Chạy tests
     results = {}
+    get_domains_outcome, get_domain_by_id_outcome, crud_outcome = asyncio.run(run_all())
     
-    try:
-        test_get_domains()
-        results["get_domains"] = {"status": "passed"}
-    except Exception as e:
-        results["get_domains"] = {"status": "failed", "error": str(e)}
-        print(f"❌ Get domains test failed: {str(e)}")
-    
-    try:
-        test_get_domain_by_id()
-        results["get_domain_by_id"] = {"status": "passed"}
-    except Exception as e:
-        results["get_domain_by_id"] = {"status": "failed", "error": str(e)}
-        print(f"❌ Get domain by ID test failed: {str(e)}")
-    
-    try:
-        if test_create_and_update_domain():
-            results["create_update_domain"] = {"status": "passed"}
-        else:
-            results["create_update_domain"] = {"status": "failed", "error": "Failed to complete CRUD operations"}
-    except Exception as e:
-        results["create_update_domain"] = {"status": "failed", "error": str(e)}
-        print(f"❌ Create/update domain test failed: {str(e)}")
+    record_result(results, "get_domains", get_domains_outcome, "Get domains")
+    record_result(results, "get_domain_by_id", get_domain_by_id_outcome, "Get domain by ID")
+    record_result(results, "create_update_domain", crud_outcome, "Create/update domain")
     
     # Lưu kết quả tests
-    results["timestamp"] = str(Path(__file__).stat().st_mtime)
+    results["timestamp"] = _MTIME
     
-    with open("tests/results/domain_test_result.json", "w", encoding="utf-8") as f:
-        json.dump(results, f, indent=2)
+    save_result("domain_test_result.json", results)
     
     # Kiểm tra kết quả tổng thể
     if all(test["status"] == "passed" for test in results.values() if isinstance(test, dict)):
         print("✅ All domain tests passed!")
     else:
-        print("⚠️ Some domain tests failed. Check the results for details.") 
\ No newline at end of file
+        print("⚠️ Some domain tests failed. Check the results for details.")
@@ -1,17 +1,26 @@
-import requests
-import json
 import os
 from pathlib import Path
+try:
+    from ._util import make_session, save_result
+except ImportError:
+    from _util import make_session, save_result
 
 # Cấu hình API endpoint
 BASE_URL = os.environ.get("API_BASE_URL", "http://localhost:8100/api")
 
+# Thời điểm sửa đổi file test (dùng làm timestamp kết quả), đọc một lần khi import
+_MTIME = str(Path(__file__).stat().st_mtime)
+HEALTH_URL = f"{BASE_URL}/health"
+
+# Health check chỉ đọc nên cho phép thử lại khi lỗi kết nối
+SESSION = make_session(retries=2)
+
 def test_health_check():
     """
     Test endpoint kiểm tra trạng thái hoạt động của API
     """
     # Gửi request
-    response = requests.get(f"{BASE_URL}/health")
+    response = SESSION.get(HEALTH_URL)
     
     # Kiểm tra status code
     assert response.status_code == 200, f"Expected status code 200 but got {response.status_code}"
@@ -32,9 +41,6 @@ def test_health_check():
     print("✅ Health check test passed")
 
 if __name__ == "__main__":
-    # Tạo thư mục để lưu kết quả
-    Path("tests/results").mkdir(parents=True, exist_ok=True)
-    
     # Chạy test
     try:
         test_health_check()
@@ -43,11 +49,10 @@ if __name__ == "__main__":
         result = {
             "test": "Health Check",
             "status": "passed",
-            "timestamp": str(Path(__file__).stat().st_mtime)
+            "timestamp": _MTIME
         }
         
-        with open("tests/results/health_test_result.json", "w", encoding="utf-8") as f:
-            json.dump(result, f, indent=2)
+        save_result("health_test_result.json", result)
             
         print("✅ All health tests passed!")
     except Exception as e:
@@ -56,11 +61,10 @@ if __name__ == "__main__":
             "test": "Health Check",
             "status": "failed",
             "error": str(e),
-            "timestamp": str(Path(__file__).stat().st_mtime)
+            "timestamp": _MTIME
         }
         
-        with open("tests/results/health_test_result.json", "w", encoding="utf-8") as f:
-            json.dump(result, f, indent=2)
+        save_result("health_test_result.json", result)
             
         print(f"❌ Test failed: {str(e)}")
         raise 
\ No newline at end of file
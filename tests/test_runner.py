@@ -2,41 +2,126 @@ import os
 import sys
 import json
 import time
-import importlib
+import io
+import importlib.util
+import contextlib
+import traceback
 from pathlib import Path
 import argparse
-import subprocess
+import asyncio
 
-def run_test_file(test_file_path, api_base_url=None):
-    """
-    Chạy một file test cụ thể bằng cách import và thực thi
-    """
+# Các file test cấu hình state toàn cục của process (logging handler của app, biến môi trường
+# của microservices) nên luôn chạy trong subprocess riêng, kể cả ở chế độ in-process
+ALWAYS_ISOLATED_FILES = {"test_diagnosis_pipeline.py"}
+
+# Số file test tối đa chạy song song ở chế độ --isolated, tránh làm quá tải API đang test
+MAX_PARALLEL_FILES = 8
+
+def _print_header(test_file_path, api_base_url=None):
     print(f"\n{'='*60}")
     print(f"Running tests in {test_file_path}...")
     print(f"{'='*60}")
+    if api_base_url:
+        print(f"Using API endpoint: {api_base_url}")
+    else:
+        print(f"Using default API endpoint: {os.environ['API_BASE_URL']}")
+
+async def run_test_file_async(test_file_path, api_base_url=None):
+    """
+    Chạy file test trong một subprocess riêng và in output (stdout + stderr) theo từng dòng
+    ngay khi có, thay vì giữ toàn bộ output trong bộ nhớ. Mỗi dòng có tiền tố tên file để
+    phân biệt khi nhiều file chạy song song. Trả về True nếu file test chạy thành công
+    """
+    _print_header(test_file_path, api_base_url)
+    prefix = f"[{Path(test_file_path).stem}] "
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, str(test_file_path),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        # Tắt buffer stdout của process con để output được đẩy ra theo từng dòng
+        env={**os.environ, "PYTHONUNBUFFERED": "1"},
+        limit=1024 * 1024
+    )
+    async for line in proc.stdout:
+        sys.stdout.write(prefix + line.decode("utf-8", errors="replace"))
+    return await proc.wait() == 0
+
+async def _run_all_isolated(test_files, api_base_url=None):
+    """
+    Chạy đồng thời các file test trong subprocess riêng, tối đa MAX_PARALLEL_FILES file cùng lúc
+    """
+    semaphore = asyncio.Semaphore(MAX_PARALLEL_FILES)
+    
+    async def run_one(test_file):
+        async with semaphore:
+            return await run_test_file_async(test_file, api_base_url)
+    
+    return await asyncio.gather(*(run_one(test_file) for test_file in test_files))
+
+def _run_in_process(test_file_path):
+    """
+    Chạy file test ngay trong process hiện tại như `python <file>` (với __name__ == "__main__"),
+    dùng lại các module đã import thay vì khởi động interpreter mới.
+    Trả về (success, stdout, stderr)
+    """
+    stdout, stderr = io.StringIO(), io.StringIO()
+    success = True
+    # Khôi phục state toàn cục mà file test có thể thay đổi khi chạy xong
+    saved_argv = sys.argv
+    saved_path = list(sys.path)
+    saved_environ = dict(os.environ)
+    sys.argv = [str(test_file_path)]
+    try:
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                spec = importlib.util.spec_from_file_location("__main__", test_file_path)
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+            except SystemExit as e:
+                success = e.code in (None, 0)
+            except Exception:
+                traceback.print_exc()
+                success = False
+    finally:
+        sys.argv = saved_argv
+        sys.path[:] = saved_path
+        os.environ.clear()
+        os.environ.update(saved_environ)
+    return success, stdout.getvalue(), stderr.getvalue()
 
+def run_test_file(test_file_path, api_base_url=None, isolated=False):
+    """
+    Chạy một file test cụ thể bằng cách import và thực thi
+    
+    isolated: chạy file test trong subprocess riêng thay vì in-process (dùng khi debug).
+    Các file trong ALWAYS_ISOLATED_FILES luôn chạy trong subprocess
+    """
     if api_base_url:
         os.environ["API_BASE_URL"] = api_base_url
-        print(f"Using API endpoint: {api_base_url}")
     else:
         # Mặc định là localhost:8100/api
         os.environ["API_BASE_URL"] = "http://localhost:8100/api"
-        print(f"Using default API endpoint: {os.environ['API_BASE_URL']}")
-    # Chạy file test như một subprocess
-    result = subprocess.run([sys.executable, test_file_path], capture_output=True, text=True)
+    
+    if isolated or Path(test_file_path).name in ALWAYS_ISOLATED_FILES:
+        return asyncio.run(run_test_file_async(test_file_path, api_base_url))
+    
+    success, stdout, stderr = _run_in_process(test_file_path)
+    
+    # In toàn bộ output của file một lần, sau khi chạy xong
+    _print_header(test_file_path, api_base_url)
     
     # In output
-    if result.stdout:
-        print(result.stdout)
+    if stdout:
+        print(stdout)
     
     # In lỗi nếu có
-    if result.stderr:
+    if stderr:
         print("ERRORS:", file=sys.stderr)
-        print(result.stderr, file=sys.stderr)
+        print(stderr, file=sys.stderr)
     
-    return result.returncode == 0
+    return success
 
-def run_all_tests(api_base_url=None):
+def run_all_tests(api_base_url=None, isolated=False):
     """
     Chạy tất cả các file test trong thư mục tests
     """
@@ -55,7 +140,12 @@ def run_all_tests(api_base_url=None):
     
     # Tìm tất cả các file test
     test_dir = Path("tests")
-    test_files = sorted([f for f in test_dir.glob("test_*.py") if f.name != "test_runner.py"])
+    with os.scandir(test_dir) as entries:
+        test_files = sorted(
+            test_dir / entry.name for entry in entries
+            if entry.name.startswith("test_") and entry.name.endswith(".py")
+            and entry.name != "test_runner.py" and entry.is_file()
+        )
     
     if not test_files:
         print("No test files found in tests directory.")
@@ -80,13 +170,18 @@ def run_all_tests(api_base_url=None):
         }
     }
     
-    # Chạy từng test file
+    if isolated:
+        # Chạy song song các test file (mỗi file là một subprocess độc lập, chủ yếu chờ API)
+        results = asyncio.run(_run_all_isolated(test_files, api_base_url))
+        outcomes = {test_file.stem: success for test_file, success in zip(test_files, results)}
+    else:
+        # Chạy in-process lần lượt từng file: stdout/stderr và sys.argv là state chung của process
+        outcomes = {test_file.stem: run_test_file(test_file, api_base_url) for test_file in test_files}
+    
+    # Cập nhật kết quả theo thứ tự các file test
     for test_file in test_files:
         test_name = test_file.stem
-        success = run_test_file(test_file)
-        
-        # Cập nhật kết quả
-        if success:
+        if outcomes[test_name]:
             test_run["tests"][test_name] = "passed"
             test_run["summary"]["passed"] += 1
         else:
@@ -112,6 +207,8 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run API tests")
     parser.add_argument("--api-url", type=str, help="Base URL for API (e.g., http://localhost:8100/api)")
     parser.add_argument("--test-file", type=str, help="Run a specific test file only")
+    parser.add_argument("--isolated", action="store_true",
+                        help="Run each test file in its own subprocess (in parallel) instead of in-process")
     
     args = parser.parse_args()
     
@@ -124,9 +221,9 @@ if __name__ == "__main__":
                 print(f"Test file not found: {args.test_file}")
                 sys.exit(1)
         
-        success = run_test_file(test_file_path, args.api_url)
+        success = run_test_file(test_file_path, args.api_url, args.isolated)
         sys.exit(0 if success else 1)
     else:
         # Chạy tất cả tests
-        success = run_all_tests(args.api_url)
+        success = run_all_tests(args.api_url, args.isolated)
         sys.exit(0 if success else 1) 
\ No newline at end of file